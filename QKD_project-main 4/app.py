@@ -1,9 +1,32 @@
-from flask import Flask, jsonify, render_template, request
-from qkd_backend.qkd_runner import exp1, exp2, exp3, exp4
+import json
+import math
+import threading
+
+from flask import Flask, Response, jsonify, render_template, request
+from qkd_backend.qkd_runner import exp1, exp2, exp3, exp4, e91
+from qkd_backend.qkd_runner.pipeline import KeyPipeline
+from qkd_backend.qkd_runner import attacks, encoding, metrics
+from qkd_backend.qkd_runner.circuit_simulator import run_circuit_simulator
+from qkd_backend.qkd_runner.link_model import SIFT_FRACTION, keyrate_curve
+from qkd_backend.qkd_runner.history import HistoryStore
 
 app = Flask(__name__, static_folder="static")
 last_exp1_result = {}
 last_exp2_result = {}
+key_pipeline = None
+key_pipeline_lock = threading.Lock()
+history_store = None
+history_store_lock = threading.Lock()
+MAX_CURVE_POINTS = 2000
+MAX_SWEEP_STRENGTHS = 50
+MAX_SIMULATOR_SHOTS = 8192
+MAX_SIMULATOR_MESSAGE = 64
+MAX_E91_PAIRS = 10_000_000
+# Per-pair lists and key strings in an E91 response are cut to this many entries
+MAX_LISTED_BITS = 10_000
+E91_LISTED_FIELDS = ("Sender_bits", "Sender_bases", "Receiver_bases", "Receiver_bits",
+                     "agoodbits", "bgoodbits", "test_indices", "error_corrected_key",
+                     "final_secret_key")
 
 # ---- Serve index.html at root ----
 @app.route("/")
@@ -18,6 +41,35 @@ def keyrate():
 def KeyrateVsDistance():
     return render_template("KeyrateVsDistance.html")
 
+def respond(result):
+    # Plain JSON unless the client asks for the compact encoding (see encoding.py)
+    mimetype = request.accept_mimetypes.best_match(encoding.supported_mimetypes(), default=encoding.JSON)
+    if mimetype == encoding.JSON:
+        return jsonify(result)
+    accept_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    body, content_type, headers = encoding.encode_response(result, mimetype, accept_gzip)
+    response = Response(body, content_type=content_type, headers=headers)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+def parse_bool(value):
+    # JSON booleans, 0/1 and "true"/"false" strings; bool("false") would be True
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "false", "1", "0"):
+        return value.strip().lower() in ("true", "1")
+    raise ValueError
+
+def get_history():
+    global history_store
+    # Concurrent first requests must not open two stores (and two writer threads)
+    with history_store_lock:
+        if history_store is None:
+            history_store = HistoryStore()
+    return history_store
+
 # ---- Experiment routes ----
 @app.route("/run/exp1", methods=["POST"])
 def exp1_route():
@@ -28,13 +80,14 @@ def exp1_route():
         # Run experiment, store result (no message yet)
         result = exp1.run_exp1()
         last_exp1_result = result
-        return jsonify(result)
+        get_history().record("exp1", result)
+        return respond(result)
     else:
         # Use previous key to encrypt/decrypt
         if not last_exp1_result:
             return jsonify({"error": "Run the experiment first!"}), 400
         result = exp1.encrypt_with_existing_key(last_exp1_result, message)
-        return jsonify(result)
+        return respond(result)
 
 @app.route("/run/exp2", methods=["POST"])
 def exp2_route():
@@ -44,29 +97,136 @@ def exp2_route():
     if message is None:
         result = exp2.run_exp2()
         last_exp2_result = result
-        return jsonify(result)
+        get_history().record("exp2", result)
+        return respond(result)
     else:
         if not last_exp2_result:
             return jsonify({"error": "Run the experiment first!"}), 400
         result = exp2.encrypt_with_existing_key(last_exp2_result, message)
-        return jsonify(result)
+        return respond(result)
 
 @app.route("/run/exp3", methods=["POST"])
 def exp3_route():
     result = exp3.run_exp3()
-    return jsonify(result)
+    get_history().record("exp3", result)
+    return respond(result)
 
 @app.route("/run/exp4", methods=["POST"])
 def exp4_route():
     result = exp4.run_exp4()
-    return jsonify(result)
+    get_history().record("exp4", result)
+    return respond(result)
+
+@app.route("/run/circuit_simulator", methods=["POST"])
+def circuit_simulator_route():
+    data = request.get_json(silent=True) or {}
+    message = data.get("message") or "QKD"
+    try:
+        shots = int(data.get("shots", 1024))
+    except (TypeError, ValueError):
+        return jsonify({"error": "shots must be an integer"}), 400
+    if not 1 <= shots <= MAX_SIMULATOR_SHOTS:
+        return jsonify({"error": f"shots must be between 1 and {MAX_SIMULATOR_SHOTS}"}), 400
+    # One qubit per message bit, simulated for every shot
+    if not isinstance(message, str) or len(message) > MAX_SIMULATOR_MESSAGE:
+        return jsonify({"error": f"message must be text of at most {MAX_SIMULATOR_MESSAGE} characters"}), 400
+    result = run_circuit_simulator(message, shots=shots)
+    get_history().record("circuit_simulator", result, {"shots": shots})
+    return respond(result)
+
+@app.route("/run/e91", methods=["POST"])
+def e91_route():
+    data = request.get_json(silent=True) or {}
+    try:
+        n_pairs = int(data.get("n_pairs", 1000))
+        noise = float(data.get("noise", 0.0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "n_pairs must be an integer and noise a number"}), 400
+    try:
+        eve = parse_bool(data.get("eve", False))
+    except ValueError:
+        return jsonify({"error": "eve must be true or false"}), 400
+    method = data.get("method", "auto")
+    message = data.get("message")
+    if method not in e91.METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(e91.METHODS)}"}), 400
+    if not 0 <= noise <= 1:
+        return jsonify({"error": "noise must be between 0 and 1"}), 400
+    # Aer simulates every pair as a circuit shot, so it gets a much lower cap
+    max_pairs = e91.AER_MAX_PAIRS if method == "aer" else MAX_E91_PAIRS
+    if not 1 <= n_pairs <= max_pairs:
+        return jsonify({"error": f"n_pairs must be between 1 and {max_pairs} for method {method}"}), 400
+    if message is not None and not isinstance(message, str):
+        return jsonify({"error": "message must be text"}), 400
+    params = {"n_pairs": n_pairs, "noise": noise, "eve": eve, "method": method}
+    result = e91.run_e91(message, **params)
+    # History needs the full lengths, so the lists are only cut for the response
+    get_history().record("e91", result, params)
+    truncated = [k for k in E91_LISTED_FIELDS if len(result.get(k) or ()) > MAX_LISTED_BITS]
+    for k in truncated:
+        result[k] = result[k][:MAX_LISTED_BITS]
+    if truncated:
+        result["truncated"] = {"fields": truncated, "max_entries": MAX_LISTED_BITS}
+    return respond(result)
+
 @app.route("/run/<exp>", methods=["POST"])
 def run_exp(exp):
-    # ... your existing code to run exp1, exp2, exp3, exp4 ...
-    # After getting the result:
-    global last_analysis
-    last_analysis = result
-    return jsonify(result)
+    # Known experiments have their own routes above; anything else is unknown
+    return jsonify({"error": f"Unknown experiment '{exp}'"}), 404
+
+@app.route("/attack_sweep", methods=["POST"])
+def attack_sweep_route():
+    data = request.get_json(silent=True) or {}
+    attack = data.get("attack", "intercept_resend")
+    if attack not in attacks.ATTACKS:
+        return jsonify({"error": f"Unknown attack '{attack}'"}), 400
+    strengths = data.get("strengths")
+    rng_seed = data.get("rng_seed")
+    try:
+        n = int(data.get("n", 100_000))
+        if strengths is not None:
+            if not isinstance(strengths, list):
+                raise ValueError
+            strengths = [float(s) for s in strengths]
+    except (TypeError, ValueError):
+        return jsonify({"error": "n must be an integer and strengths a list of numbers"}), 400
+    if n < 1:
+        return jsonify({"error": "n must be positive"}), 400
+    if strengths is not None and not 1 <= len(strengths) <= MAX_SWEEP_STRENGTHS:
+        return jsonify({"error": f"strengths must have 1 to {MAX_SWEEP_STRENGTHS} values"}), 400
+    if strengths is not None and not all(0 <= s <= 1 for s in strengths):
+        return jsonify({"error": "strengths must be between 0 and 1"}), 400
+    if rng_seed is not None and (not isinstance(rng_seed, int) or rng_seed < 0):
+        return jsonify({"error": "rng_seed must be a non-negative integer"}), 400
+    results = attacks.sweep_attack(attack, strengths, n=min(n, 10_000_000), rng_seed=rng_seed)
+    return jsonify(results)
+
+@app.route("/api/keyrate_curve")
+def keyrate_curve_route():
+    args = request.args
+    protocol = args.get("protocol", "bb84")
+    if protocol not in SIFT_FRACTION:
+        return jsonify({"error": f"Unknown protocol '{protocol}'"}), 400
+    max_distance = args.get("max_distance", default=100.0, type=float)
+    step = args.get("step", default=2.0, type=float)
+    if not (math.isfinite(max_distance) and math.isfinite(step) and max_distance >= 0 and step > 0):
+        return jsonify({"error": "max_distance must be >= 0 and step > 0"}), 400
+    if max_distance / step + 1 > MAX_CURVE_POINTS:
+        return jsonify({"error": f"At most {MAX_CURVE_POINTS} points per curve, use a larger step"}), 400
+    distances = [d * step for d in range(int(max_distance // step) + 1)]
+    if distances[-1] < max_distance:
+        distances.append(max_distance)
+    curve = keyrate_curve(
+        distances,
+        rep_rate=args.get("rep_rate", default=1e6, type=float),
+        mu=args.get("mu", default=0.5, type=float),
+        attenuation_db_km=args.get("attenuation", default=0.2, type=float),
+        detector_eff=args.get("detector_eff", default=0.1, type=float),
+        dark_count_prob=args.get("dark_count_prob", default=1e-4, type=float),
+        misalignment=args.get("misalignment", default=0.01, type=float),
+        protocol=protocol,
+    )
+    return jsonify(curve)
 
 @app.route("/analysis")
 def analysis():
@@ -78,8 +238,80 @@ def shors():
 
 @app.route("/get_last_analysis")
 def get_last_analysis():
-    global last_analysis
-    return jsonify(last_analysis)
+    run = get_history().latest(request.args.get("experiment"))
+    if run is None:
+        return jsonify({})
+    # Same shape the analysis page used before: result fields plus QBER in percent
+    return jsonify({**run["detail"], "experiment": run["experiment"],
+                    "qber": run["qber"] * 100 if run["qber"] is not None else None})
+
+# ---- Experiment history ----
+def history_filters(args):
+    params = args.get("params")
+    return {
+        "experiment": args.get("experiment") or None,
+        "since": args.get("since", type=float),
+        "until": args.get("until", type=float),
+        "min_qber": args.get("min_qber", type=float),
+        "max_qber": args.get("max_qber", type=float),
+        "params": json.loads(params) if params else None,
+    }
+
+@app.route("/api/history")
+def history_route():
+    limit = min(max(request.args.get("limit", default=50, type=int), 1), 500)
+    try:
+        page = get_history().query(limit=limit, cursor=request.args.get("cursor"),
+                                   **history_filters(request.args))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(page)
+
+@app.route("/api/history/qber_distribution")
+def qber_distribution_route():
+    bins = min(max(request.args.get("bins", default=20, type=int), 1), 200)
+    try:
+        filters = history_filters(request.args)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(get_history().qber_distribution(bins=bins, **filters))
+
+@app.route("/api/history/key_rate_trend")
+def key_rate_trend_route():
+    bucket = max(request.args.get("bucket", default=3600, type=int), 1)
+    try:
+        filters = history_filters(request.args)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(get_history().key_rate_trend(bucket_seconds=bucket, **filters))
+
+# ---- Continuous key generation ----
+def get_key_pipeline():
+    global key_pipeline
+    # Concurrent first requests must not start two pipelines
+    with key_pipeline_lock:
+        if key_pipeline is None:
+            key_pipeline = KeyPipeline().start()
+    return key_pipeline
+
+@app.route("/pipeline/key")
+def pipeline_key():
+    n_bytes = request.args.get("bytes", default=32, type=int)
+    if n_bytes <= 0 or n_bytes > 4096:
+        return jsonify({"error": "bytes must be between 1 and 4096"}), 400
+    key = get_key_pipeline().key_buffer.take(n_bytes, timeout=5.0)
+    if key is None:
+        return jsonify({"error": "Key buffer not filled yet, try again"}), 503
+    return jsonify({"key_hex": key.hex(), "bytes": n_bytes})
+
+@app.route("/pipeline/stats")
+def pipeline_stats():
+    return jsonify(get_key_pipeline().stats())
+
+# ---- Prometheus scrape endpoint ----
+@app.route("/metrics")
+def metrics_route():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
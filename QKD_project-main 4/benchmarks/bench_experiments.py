@@ -0,0 +1,59 @@
+# benchmarks/bench_experiments.py
+# End-to-end experiment runs for increasing problem sizes. exp1-exp3 use the
+# local noisy device snapshot selected in conftest.py instead of IBM Quantum.
+
+import pytest
+
+from qkd_backend.qkd_runner.circuit_simulator import run_circuit_simulator
+
+pytestmark = pytest.mark.experiment
+
+
+def _run(benchmark, func, *args, **kwargs):
+    # Each call builds, transpiles and simulates circuits; a few rounds are enough
+    return benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("length", [1, 4, 16])
+def bench_circuit_simulator(benchmark, length):
+    _run(benchmark, run_circuit_simulator, "QKD demo message"[:length])
+
+
+@pytest.mark.parametrize("n", [10, 20, 40])
+def bench_exp4(benchmark, workdir, n):
+    from qkd_backend.qkd_runner import exp4
+    _run(benchmark, exp4.run_exp4, "QKD demo", n)
+
+
+# BB84 circuits are Clifford product states, so the stabilizer path scales to thousands of qubits
+@pytest.mark.parametrize("n", [500, 2000])
+def bench_exp4_large(benchmark, workdir, n):
+    from qkd_backend.qkd_runner import exp4
+    _run(benchmark, exp4.run_exp4, "QKD demo", n, diagram=False)
+
+
+# Noisy simulation cost grows quickly with qubit count; 12 already takes seconds per run
+@pytest.mark.parametrize("bit_num", [4, 8, 12])
+def bench_exp1(benchmark, workdir, bit_num):
+    from qkd_backend.qkd_runner import exp1
+    _run(benchmark, exp1.run_exp1, "QKD demo", bit_num)
+
+
+@pytest.mark.parametrize("bit_num", [4, 8, 12])
+def bench_exp2(benchmark, workdir, bit_num):
+    from qkd_backend.qkd_runner import exp2
+    _run(benchmark, exp2.run_exp2, "QKD demo", bit_num, rng_seed=0)
+
+
+@pytest.mark.parametrize("bit_num", [4, 8, 12])
+def bench_exp3(benchmark, workdir, bit_num):
+    from qkd_backend.qkd_runner import exp3
+    _run(benchmark, exp3.run_exp3, None, bit_num, rng_seed=0)
+
+
+@pytest.mark.parametrize("method,n_pairs", [("fast", 10_000), ("fast", 1_000_000),
+                                            ("aer", 10_000), ("aer", 100_000)])
+def bench_e91(benchmark, method, n_pairs):
+    from qkd_backend.qkd_runner import e91
+    _run(benchmark, e91.run_e91, None, n_pairs, noise=0.05, method=method, rng_seed=0,
+         diagram=False)
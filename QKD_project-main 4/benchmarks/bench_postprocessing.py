@@ -0,0 +1,102 @@
+# benchmarks/bench_postprocessing.py
+# Classical post-processing: encryption, sifting, estimation, reconciliation,
+# amplification, the multi-user / link-model calculations and response encoding.
+
+import json
+
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner import encoding, exp1, exp4, multiuser
+from qkd_backend.qkd_runner.link_model import simulate_link, keyrate_curve
+from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+from qkd_backend.qkd_runner.pipeline import cascade_correct, privacy_amplify
+from qkd_backend.qkd_runner.sifting import sift
+
+SIZES = [1_000, 100_000, 1_000_000]
+
+
+def _bb84_round(n, error_rate=0.03, seed=0):
+    rng = np.random.default_rng(seed)
+    abits = rng.integers(0, 2, n, dtype=np.uint8)
+    abase = rng.integers(0, 2, n, dtype=np.uint8)
+    bbase = rng.integers(0, 2, n, dtype=np.uint8)
+    bbits = abits ^ (rng.random(n) < error_rate).astype(np.uint8)
+    return abits, abase, bbase, bbits
+
+
+@pytest.mark.parametrize("n_bytes", [64, 4096])
+def bench_xor_encrypt_decrypt_bytes(benchmark, n_bytes):
+    message = bytes(n_bytes)
+    key_bits = [1, 0, 1, 1, 0, 0, 1, 0] * 16
+    benchmark(exp1.xor_encrypt_decrypt, message, key_bits)
+
+
+@pytest.mark.parametrize("n_bytes", [64, 4096])
+def bench_xor_encrypt_decrypt_bits(benchmark, n_bytes):
+    message = bytes(n_bytes)
+    key_bits = [1, 0, 1, 1, 0, 0, 1, 0] * 16
+    benchmark(exp4.xor_encrypt_decrypt, message, key_bits)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def bench_sift(benchmark, n):
+    benchmark(sift, *_bb84_round(n))
+
+
+@pytest.mark.parametrize("n", SIZES)
+def bench_estimate_qber(benchmark, n):
+    agood, bgood, _, _ = sift(*_bb84_round(n))
+    benchmark(estimate_qber, agood, bgood, 0.1, 0)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def bench_cascade_correct(benchmark, n):
+    agood, bgood, _, _ = sift(*_bb84_round(n))
+    benchmark.pedantic(cascade_correct, args=(agood, bgood, 24), kwargs={"rng": 0},
+                       rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("n", SIZES)
+def bench_privacy_amplify(benchmark, n):
+    agood, _, _, _ = sift(*_bb84_round(n))
+    benchmark(privacy_amplify, agood, 0.05, len(agood) // 8)
+
+
+@pytest.mark.parametrize("n_pulses", [10**6, 10**7])
+def bench_simulate_link(benchmark, n_pulses):
+    benchmark.pedantic(simulate_link, args=(n_pulses,),
+                       kwargs={"distance_km": 50, "afterpulse_prob": 0.01, "dead_time_pulses": 5, "rng": 0},
+                       rounds=3, iterations=1)
+
+
+def bench_keyrate_curve(benchmark):
+    benchmark(keyrate_curve, range(0, 301, 2))
+
+
+@pytest.mark.parametrize("n_users", [3, 100])
+def bench_multiuser(benchmark, n_users):
+    link_stats = multiuser.calculate_link_stats(90, 1e-5, 0.2, 2, 100, 0.5, 100, 0.01, 50, 10**6, rng=0)
+    link_rate = multiuser.calculate_link_rate(link_stats, 100)
+    distances = [int(500 * (i + 1) / n_users) for i in range(n_users)]
+    benchmark(multiuser.simulate_users, distances, 100, link_stats, link_rate, 256, 5)
+
+
+def _circuit_result(n_bits, n_outcomes, seed=0):
+    # Shape of a circuit_simulator result: bit lists, a large counts dict and per-outcome steps
+    rng = np.random.default_rng(seed)
+    outcomes = {"".join(map(str, row)): int(c) for row, c in
+                zip(rng.integers(0, 2, (n_outcomes, n_bits)), rng.integers(1, 10, n_outcomes))}
+    steps = [{"bitstring": k, "qubit": i, "Sender_bit": 0, "Receiver_bit": 1, "mismatch": True}
+             for k in outcomes for i in range(0, n_bits, 4)]
+    bits = rng.integers(0, 2, n_bits).tolist()
+    return {"Sender_bits": bits, "Receiver_bits": bits, "counts": outcomes, "steps": steps}
+
+
+@pytest.mark.parametrize("fmt", ["json", "compact_json", "compact_json_gzip"])
+def bench_encode_response(benchmark, fmt):
+    result = _circuit_result(64, 1024)
+    if fmt == "json":
+        benchmark(lambda: json.dumps(result).encode("utf-8"))
+    else:
+        benchmark(encoding.encode_response, result, encoding.COMPACT_JSON, fmt.endswith("gzip"))
@@ -0,0 +1,41 @@
+# gunicorn.conf.py
+# Production serving for app.py:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The app is loaded and warmed once in the master (qiskit imports, backend
+# selection, transpiler and noise model via backends.warmup) and then forked,
+# so workers start with those caches already built.
+#
+#   QKD_BIND              address to listen on (default 0.0.0.0:8000)
+#   QKD_WORKERS           worker processes (default: CPU count)
+#   QKD_THREADS           threads per worker (default 4)
+#   QKD_TIMEOUT           seconds before a silent worker is restarted (default 300;
+#                         hardware runs on IBM backends can queue for minutes)
+#   QKD_GRACEFUL_TIMEOUT  seconds to finish in-flight runs on restart (default 60)
+#   QKD_WARMUP            set to 0 to skip the pre-fork warmup
+
+import os
+
+bind = os.environ.get("QKD_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("QKD_WORKERS", os.cpu_count() or 1))
+# Simulations release the GIL inside Aer, so a few threads per worker keep cores busy
+worker_class = "gthread"
+threads = int(os.environ.get("QKD_THREADS", "4"))
+timeout = int(os.environ.get("QKD_TIMEOUT", "300"))
+graceful_timeout = int(os.environ.get("QKD_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+preload_app = True
+accesslog = "-"
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker is forked
+    if os.environ.get("QKD_WARMUP", "1") != "0":
+        from qkd_backend.qkd_runner.backends import warmup
+        warmup()
+
+
+def post_fork(server, worker):
+    from qkd_backend.qkd_runner.backends import after_fork
+    after_fork()
@@ -0,0 +1,7 @@
+# qkd_backend/__main__.py
+# python -m qkd_backend: headless batch CLI (see qkd_runner/cli.py)
+
+from qkd_backend.qkd_runner.cli import main
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+# qkd_backend/qkd_runner/attacks.py
+# Eavesdropping attacks on BB84 simulated in one vectorized pass.
+#
+# Qubit states are real-plane angles: |psi> = cos(phi)|0> + sin(phi)|1>, so
+# |0> = 0, |1> = pi/2, |+> = pi/4, |-> = -pi/4. Measuring in a basis at angle
+# beta gives outcome 0 with probability cos^2(phi - beta) and leaves the
+# qubit at beta (outcome 0) or beta + pi/2 (outcome 1). That covers the Z and
+# X bases as well as Breidbart's intermediate basis at pi/8.
+
+import numpy as np
+
+from qkd_backend.qkd_runner.sifting import sift
+
+BASIS_ANGLE = np.array([0.0, np.pi / 4])   # 0 = Z-basis, 1 = X-basis
+BREIDBART_ANGLE = np.pi / 8
+
+
+def _measure(phi, beta, rng):
+    outcome = (rng.random(phi.shape) >= np.cos(phi - beta) ** 2).astype(np.uint8)
+    return outcome, beta + outcome * (np.pi / 2)
+
+
+def _prepare(n, rng):
+    abits = rng.integers(0, 2, n, dtype=np.uint8)
+    abase = rng.integers(0, 2, n, dtype=np.uint8)
+    bbase = rng.integers(0, 2, n, dtype=np.uint8)
+    phi = BASIS_ANGLE[abase] + abits * (np.pi / 2)
+    return abits, abase, bbase, phi
+
+
+def _summary(abits, abase, bbase, bbits, eve_known, detected=None, extra=None):
+    # Common result dict: QBER seen by Alice/Bob and how much of the sifted key Eve holds
+    if detected is not None:
+        abits, abase, bbase, bbits, eve_known = (
+            x[detected] for x in (abits, abase, bbase, bbits, eve_known))
+    agood, bgood, matched, errors = sift(abits, abase, bbase, bbits)
+    sifted = len(agood)
+    result = {
+        "sifted_length": sifted,
+        "errors": errors,
+        "qber": errors / sifted if sifted else 0.0,
+        "eve_information": float(np.count_nonzero(eve_known[matched])) / sifted if sifted else 0.0,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def intercept_resend(n, fraction=1.0, rng=None, breidbart=False, channel_error=0.0):
+    # Eve measures a random `fraction` of the qubits and resends what she saw.
+    # With breidbart=True she uses the pi/8 basis instead of guessing Z or X.
+    rng = np.random.default_rng(rng)
+    abits, abase, bbase, phi = _prepare(n, rng)
+
+    attacked = rng.random(n) < fraction
+    if breidbart:
+        ebeta = np.full(n, BREIDBART_ANGLE)
+    else:
+        ebase = rng.integers(0, 2, n, dtype=np.uint8)
+        ebeta = BASIS_ANGLE[ebase]
+    ebits, resent = _measure(phi, ebeta, rng)
+    phi = np.where(attacked, resent, phi)
+
+    bbits, _ = _measure(phi, BASIS_ANGLE[bbase], rng)
+    bbits ^= (rng.random(n) < channel_error).astype(np.uint8)
+
+    # Eve's guess of Alice's bit after bases are announced
+    if breidbart:
+        eve_guess = ebits
+    else:
+        eve_guess = np.where(ebase == abase, ebits, rng.integers(0, 2, n, dtype=np.uint8))
+    eve_known = attacked & (eve_guess == abits)
+    return _summary(abits, abase, bbase, bbits, eve_known,
+                    extra={"attack": "breidbart" if breidbart else "intercept_resend",
+                           "strength": fraction})
+
+
+def breidbart(n, fraction=1.0, rng=None, channel_error=0.0):
+    return intercept_resend(n, fraction, rng, breidbart=True, channel_error=channel_error)
+
+
+def _weak_coherent_channel(n, mu, rng):
+    abits, abase, bbase, phi = _prepare(n, rng)
+    photons = rng.poisson(mu, n)
+    return abits, abase, bbase, phi, photons
+
+
+def photon_number_splitting(n, fraction=1.0, mu=0.5, transmittance=0.1, rng=None,
+                            channel_error=0.0):
+    # Eve counts photons in each attacked pulse: multi-photon pulses lose one
+    # photon to her quantum memory and go on through a lossless channel, and
+    # single photons are blocked just often enough that Bob still sees the
+    # detection rate he expects from the fibre. She measures her stored photon
+    # after basis reconciliation, so she learns those bits without adding errors.
+    rng = np.random.default_rng(rng)
+    abits, abase, bbase, phi, photons = _weak_coherent_channel(n, mu, rng)
+
+    expected = 1 - np.exp(-mu * transmittance)
+    p_single = mu * np.exp(-mu)
+    p_multi = 1 - np.exp(-mu) - p_single
+    pass_multi = min(1.0, expected / p_multi) if p_multi > 0 else 0.0
+    pass_single = max(0.0, expected - p_multi) / p_single if p_single > 0 else 0.0
+
+    attacked = rng.random(n) < fraction
+    u = rng.random(n)
+    split = attacked & (photons >= 2) & (u < pass_multi)
+    single = attacked & (photons == 1) & (u < pass_single)
+    # Bob clicks on forwarded pulses (lossless) and on untouched pulses through the normal channel
+    detected = np.where(attacked, split | single, rng.binomial(photons, transmittance) > 0)
+
+    bbits, _ = _measure(phi, BASIS_ANGLE[bbase], rng)
+    bbits ^= (rng.random(n) < channel_error).astype(np.uint8)
+    return _summary(abits, abase, bbase, bbits, split, detected,
+                    extra={"attack": "photon_number_splitting", "strength": fraction,
+                           "detection_rate": float(np.count_nonzero(detected)) / n})
+
+
+def beam_splitting(n, fraction=1.0, mu=0.5, transmittance=0.1, rng=None, channel_error=0.0):
+    # Eve replaces the lossy fibre and taps off `fraction` of the loss with a
+    # beam splitter. Any photon she keeps reveals the bit once bases are public.
+    rng = np.random.default_rng(rng)
+    abits, abase, bbase, phi, photons = _weak_coherent_channel(n, mu, rng)
+
+    tapped = rng.binomial(photons, fraction * (1 - transmittance))
+    arriving = rng.binomial(photons - tapped,
+                            min(1.0, transmittance / (1 - fraction * (1 - transmittance))))
+    detected = arriving > 0
+
+    bbits, _ = _measure(phi, BASIS_ANGLE[bbase], rng)
+    bbits ^= (rng.random(n) < channel_error).astype(np.uint8)
+    return _summary(abits, abase, bbase, bbits, tapped > 0, detected,
+                    extra={"attack": "beam_splitting", "strength": fraction,
+                           "detection_rate": float(np.count_nonzero(detected)) / n})
+
+
+ATTACKS = {
+    "intercept_resend": intercept_resend,
+    "breidbart": breidbart,
+    "photon_number_splitting": photon_number_splitting,
+    "beam_splitting": beam_splitting,
+}
+
+
+def run_attack(attack, n=100_000, strength=1.0, rng=None, **kwargs):
+    if attack not in ATTACKS:
+        raise ValueError(f"Unknown attack '{attack}', choose from {sorted(ATTACKS)}")
+    return ATTACKS[attack](n, strength, rng=rng, **kwargs)
+
+
+def sweep_attack(attack, strengths=None, n=100_000, rng_seed=None, **kwargs):
+    # Attack strength vs observed QBER and Eve's information on the sifted key
+    if strengths is None:
+        strengths = np.linspace(0, 1, 11)
+    rng = np.random.default_rng(rng_seed)
+    return [run_attack(attack, n, float(s), rng, **kwargs) for s in strengths]
@@ -0,0 +1,93 @@
+# qkd_backend/qkd_runner/backends.py
+# Backend used by the hardware experiments (exp1-exp3).
+# QKD_BACKEND names the IBM device (default ibm_brisbane); a "fake_" prefix,
+# e.g. QKD_BACKEND=fake_brisbane, selects the local noisy snapshot of that
+# device from qiskit_ibm_runtime.fake_provider so no IBM account is needed.
+
+import logging
+import os
+import time
+from functools import lru_cache
+
+from qkd_backend.qkd_runner.qkd_logging import event, get_logger
+
+DEFAULT_BACKEND = "ibm_brisbane"
+log = get_logger("backends")
+
+
+def get_backend(name=None):
+    return _load_backend(name or os.environ.get("QKD_BACKEND", DEFAULT_BACKEND))
+
+
+@lru_cache(maxsize=None)
+def _load_backend(name):
+    if name.startswith("fake_"):
+        from qiskit_ibm_runtime import fake_provider
+        class_name = "Fake" + "".join(part.capitalize() for part in name[len("fake_"):].split("_"))
+        backend = getattr(fake_provider, class_name)()
+    else:
+        from qiskit_ibm_runtime import QiskitRuntimeService
+        backend = QiskitRuntimeService().backend(name)
+    event(log, logging.INFO, "backend_selected", backend=backend.name, qubits=backend.num_qubits)
+    return backend
+
+
+# Transpilers, noise models and simulators are built once per process and reused by every run.
+# warmup() builds them before a server forks its workers; after_fork() readies each worker.
+
+@lru_cache(maxsize=None)
+def get_pass_manager(optimization_level=3, name=None):
+    from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+    return generate_preset_pass_manager(target=get_backend(name).target,
+                                        optimization_level=optimization_level)
+
+
+@lru_cache(maxsize=None)
+def get_noise_model(name=None):
+    from qiskit_aer.noise import NoiseModel
+    return NoiseModel.from_backend(get_backend(name))
+
+
+@lru_cache(maxsize=None)
+def get_simulator(noisy=False, method="automatic"):
+    # Ideal simulator (see stabilizer.run_counts), or one with the backend's noise model
+    from qiskit_aer import AerSimulator
+    if noisy:
+        return AerSimulator(method=method, noise_model=get_noise_model())
+    return AerSimulator(method=method)
+
+
+def warmup(name=None):
+    # Pre-fork warmup: imports qiskit, selects the backend and builds the transpiler
+    # (running it once on a template circuit) and the noise model. Nothing is executed
+    # on Aer here: Aer's thread pools do not survive fork, see after_fork().
+    t0 = time.perf_counter()
+    from qiskit import QuantumCircuit
+    import qiskit_aer  # noqa: F401
+    import qiskit_ibm_runtime  # noqa: F401
+    try:
+        backend = get_backend(name)
+        template = QuantumCircuit(2, 2)
+        template.h(0)
+        template.measure([0, 1], [0, 1])
+        get_pass_manager(name=name).run(template)
+        get_noise_model(name)
+    except Exception as exc:
+        # An unreachable IBM backend must not keep the server from starting;
+        # the hardware routes then fail per request instead
+        event(log, logging.WARNING, "warmup_failed", error=f"{type(exc).__name__}: {exc}")
+        return False
+    event(log, logging.INFO, "warmup_done", backend=backend.name,
+          seconds=round(time.perf_counter() - t0, 3))
+    return True
+
+
+def after_fork():
+    # Run in each forked worker. The transpiler's thread pool was started in the parent
+    # and would deadlock the child, so serial transpilation is forced as qiskit does for
+    # its own parallel workers; the ideal simulator is then warmed with a tiny circuit.
+    os.environ["QISKIT_IN_PARALLEL"] = "TRUE"
+    from qiskit import QuantumCircuit
+    qc = QuantumCircuit(1, 1)
+    qc.measure(0, 0)
+    get_simulator().run(qc, shots=1).result()
@@ -2,7 +2,9 @@
 import random
 import numpy as np
 from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.sifting import sift, bitstring_to_bits
+from qkd_backend.qkd_runner.stabilizer import run_counts
 
 def text_to_bits(text):
     return [int(b) for c in text for b in bin(ord(c))[2:].zfill(8)]
@@ -10,57 +12,58 @@ def text_to_bits(text):
 def random_bases(n):
     return [random.choice(['+', 'x']) for _ in range(n)]
 
+@metrics.instrument("circuit_simulator")
 def run_circuit_simulator(message, shots=1024):
     bits = text_to_bits(message)
     n = len(bits)
     Sender_bases = random_bases(n)
     Receiver_bases = random_bases(n)
 
-    qc = QuantumCircuit(n, n)
-    for i in range(n):
-        if bits[i] == 1:
-            qc.x(i)
-        if Sender_bases[i] == 'x':
-            qc.h(i)
-    for i in range(n):
-        if Receiver_bases[i] == 'x':
-            qc.h(i)
-        qc.measure(i, i)
+    with metrics.span("circuit_simulator", "circuit"):
+        qc = QuantumCircuit(n, n)
+        for i in range(n):
+            if bits[i] == 1:
+                qc.x(i)
+            if Sender_bases[i] == 'x':
+                qc.h(i)
+        for i in range(n):
+            if Receiver_bases[i] == 'x':
+                qc.h(i)
+            qc.measure(i, i)
 
     try:
         qasm_str = qc.qasm()
     except Exception:
         qasm_str = ""
 
-    sim = AerSimulator()
-    job = sim.run(qc, shots=shots)
-    result = job.result()
-    counts = result.get_counts()
-    counts_int = {str(k): int(v) for k, v in counts.items()}
+    with metrics.span("circuit_simulator", "simulate"):
+        counts = run_counts(qc, shots=shots)
+        counts_int = {str(k): int(v) for k, v in counts.items()}
 
-    matched_positions = [i for i in range(n) if Sender_bases[i] == Receiver_bases[i]]
-    total = 0
-    errors = 0
-    step_details = []
-    for bitstring, freq in counts_int.items():
-        Receiver_bits = [int(b) for b in bitstring[::-1]]
-        for i in matched_positions:
-            Sender_bit = bits[i]
-            Receiver_bit = Receiver_bits[i] if i < len(Receiver_bits) else None
-            mismatch = (Receiver_bit is None) or (Receiver_bit != Sender_bit)
-            total += freq
-            if mismatch:
-                errors += freq
-            step_details.append({
+    with metrics.span("circuit_simulator", "postprocess"):
+        abase = np.array(Sender_bases) == 'x'
+        bbase = np.array(Receiver_bases) == 'x'
+        total = 0
+        errors = 0
+        step_details = []
+        for bitstring, freq in counts_int.items():
+            Receiver_bits = bitstring_to_bits(bitstring, n)
+            agood, bgood, matched_positions, bitstring_errors = sift(bits, abase, bbase, Receiver_bits)
+            total += freq * len(matched_positions)
+            errors += freq * bitstring_errors
+            mismatches = agood != bgood
+            step_details.extend({
                 "bitstring": bitstring,
                 "freq": int(freq),
-                "qubit": i,
-                "Sender_bit": int(Sender_bit),
-                "Receiver_bit": (int(Receiver_bit) if Receiver_bit is not None else None),
+                "qubit": int(i),
+                "Sender_bit": int(a),
+                "Receiver_bit": int(b),
                 "basis": Sender_bases[i],
-                "mismatch": bool(mismatch)
-            })
-    qber = (errors / total * 100) if total > 0 else 0.0
+                "mismatch": bool(m)
+            } for i, a, b, m in zip(matched_positions.tolist(), agood.tolist(), bgood.tolist(), mismatches.tolist()))
+        qber = (errors / total * 100) if total > 0 else 0.0
+
+    metrics.record_run("circuit_simulator", qber=qber / 100, sifted_length=total)
 
     return {
         "qasm": qasm_str,
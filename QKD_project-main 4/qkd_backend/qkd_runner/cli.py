@@ -0,0 +1,250 @@
+# qkd_backend/qkd_runner/cli.py
+# Headless batch runner behind `python -m qkd_backend`.
+# Runs the experiments, the multi-user model and the key-rate curve without
+# Flask, Streamlit or matplotlib, writing one NDJSON line (or Parquet row) per run.
+#
+#   python -m qkd_backend list
+#   python -m qkd_backend run exp2 --set bit_num=8 --repeat 20 --workers 4 -o exp2.ndjson
+#   python -m qkd_backend run keyrate_curve --set "distances=[0, 50, 100]"
+#   python -m qkd_backend batch campaign.yaml --workers 8 -o campaign.parquet
+#
+# A config file (JSON or YAML) lists jobs; "sweep" runs the cartesian product
+# of its lists on top of "params", and top-level "workers"/"output"/"history"
+# are used when the matching flag is not given:
+#
+#   workers: 4
+#   output: campaign.ndjson
+#   jobs:
+#     - experiment: exp3
+#       params: {bit_num: 12, shots: 2048}
+#       repeat: 10
+#     - experiment: keyrate_curve
+#       params: {distances: [0, 25, 50, 100], n_pulses: 1000000}
+#       sweep: {mu: [0.1, 0.3, 0.5]}
+
+import argparse
+import importlib
+import itertools
+import json
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# name -> (module, function, default params); modules are imported in the worker
+EXPERIMENTS = {
+    "exp1": ("qkd_backend.qkd_runner.exp1", "run_exp1", {}),
+    "exp2": ("qkd_backend.qkd_runner.exp2", "run_exp2", {"diagram": False}),
+    "exp3": ("qkd_backend.qkd_runner.exp3", "run_exp3", {"diagram": False}),
+    "exp4": ("qkd_backend.qkd_runner.exp4", "run_exp4", {"diagram": False}),
+    "e91": ("qkd_backend.qkd_runner.e91", "run_e91", {"diagram": False}),
+    "circuit_simulator": ("qkd_backend.qkd_runner.circuit_simulator", "run_circuit_simulator",
+                          {"message": "QKD"}),
+    "multiuser": ("qkd_backend.qkd_runner.multiuser", "run_multiuser", {}),
+    "keyrate_curve": ("qkd_backend.qkd_runner.link_model", "keyrate_curve",
+                      {"distances": list(range(0, 201, 10))}),
+    "attack_sweep": ("qkd_backend.qkd_runner.attacks", "sweep_attack",
+                     {"attack": "intercept_resend"}),
+}
+
+
+def _jsonable(obj):
+    # numpy values to plain Python, non-finite floats to None (NDJSON must stay valid JSON)
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _jsonable(obj.tolist())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    if isinstance(obj, bytes):
+        return obj.hex()
+    return obj
+
+
+def load_config(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("YAML configs need PyYAML (pip install pyyaml)")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if isinstance(config, list):
+        config = {"jobs": config}
+    return config
+
+
+def expand_jobs(jobs):
+    tasks = []
+    for job_id, job in enumerate(jobs):
+        name = job["experiment"]
+        if name not in EXPERIMENTS:
+            raise ValueError(f"Unknown experiment '{name}', choose from {sorted(EXPERIMENTS)}")
+        sweep = job.get("sweep") or {}
+        keys = list(sweep)
+        for combo in itertools.product(*(sweep[k] for k in keys)):
+            params = {**(job.get("params") or {}), **dict(zip(keys, combo))}
+            for rep in range(int(job.get("repeat", 1))):
+                tasks.append({"task": len(tasks), "job": job_id, "experiment": name,
+                              "repeat": rep, "params": params})
+    return tasks
+
+
+def run_task(task):
+    module, func, defaults = EXPERIMENTS[task["experiment"]]
+    record = dict(task)
+    t0 = time.perf_counter()
+    try:
+        fn = getattr(importlib.import_module(module), func)
+        record["result"] = _jsonable(fn(**{**defaults, **task["params"]}))
+        record["error"] = None
+    except Exception as exc:
+        record["result"] = None
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    record["seconds"] = round(time.perf_counter() - t0, 6)
+    return record
+
+
+def run_tasks(tasks, workers=1):
+    # Yields records as they finish; workers > 1 runs them in separate processes
+    if workers <= 1:
+        for task in tasks:
+            yield run_task(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(run_task, t) for t in tasks]):
+            yield future.result()
+
+
+class NdjsonWriter:
+    def __init__(self, path):
+        self._f = sys.stdout if path in (None, "-") else open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._f.write(json.dumps(_jsonable(record), separators=(",", ":")) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f is not sys.stdout:
+            self._f.close()
+
+
+class ParquetWriter:
+    # params/result are nested and differ per experiment, so they are stored as JSON strings
+    def __init__(self, path):
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pandas and pyarrow (pip install pandas pyarrow)")
+        self.path = path
+        self._rows = []
+
+    def write(self, record):
+        row = dict(record)
+        row["params"] = json.dumps(_jsonable(row["params"]))
+        row["result"] = json.dumps(_jsonable(row["result"]))
+        self._rows.append(row)
+
+    def close(self):
+        import pandas as pd
+        pd.DataFrame(self._rows).sort_values("task").to_parquet(self.path, index=False)
+
+
+def open_writer(path):
+    if path and path.endswith(".parquet"):
+        return ParquetWriter(path)
+    return NdjsonWriter(path)
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _parse_sets(pairs):
+    params = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects key=value, got '{pair}'")
+        params[key] = _parse_value(value)
+    return params
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m qkd_backend",
+                                     description="Run QKD experiments and sweeps headless.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="list runnable experiments and their default params")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output", help="NDJSON file, .parquet file, or - for stdout")
+    common.add_argument("-w", "--workers", type=int, help="parallel worker processes (default 1)")
+    common.add_argument("--history", metavar="DB",
+                        help="also append experiment runs to this SQLite history database")
+
+    run = sub.add_parser("run", parents=[common], help="run one experiment")
+    run.add_argument("experiment", choices=sorted(EXPERIMENTS))
+    run.add_argument("--set", action="append", metavar="KEY=VALUE",
+                     help="parameter override, value parsed as JSON when possible")
+    run.add_argument("--repeat", type=int, default=1)
+
+    batch = sub.add_parser("batch", parents=[common], help="run the jobs in a JSON/YAML config")
+    batch.add_argument("config")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "list":
+        for name, (module, func, defaults) in sorted(EXPERIMENTS.items()):
+            print(f"{name:18} {module}.{func} {json.dumps(defaults)}")
+        return 0
+
+    if args.command == "run":
+        config = {"jobs": [{"experiment": args.experiment, "params": _parse_sets(args.set),
+                            "repeat": args.repeat}]}
+    else:
+        config = load_config(args.config)
+
+    try:
+        tasks = expand_jobs(config.get("jobs") or [])
+    except (KeyError, ValueError) as exc:
+        raise SystemExit(f"Invalid config: {exc}")
+    workers = args.workers or int(config.get("workers", 1))
+    writer = open_writer(args.output or config.get("output"))
+    history_path = args.history or config.get("history")
+    store = None
+    if history_path:
+        from qkd_backend.qkd_runner.history import HistoryStore
+        store = HistoryStore(history_path)
+
+    t0 = time.perf_counter()
+    failed = 0
+    try:
+        for record in run_tasks(tasks, workers):
+            failed += record["error"] is not None
+            writer.write(record)
+            # Curves and sweeps return lists; only single experiment runs go to the history
+            if store is not None and isinstance(record["result"], dict):
+                store.record(record["experiment"], record["result"], record["params"])
+    finally:
+        writer.close()
+        if store is not None:
+            store.close()
+    print(f"{len(tasks)} runs, {failed} failed, {time.perf_counter() - t0:.1f}s",
+          file=sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,18 @@
+# qkd_backend/qkd_runner/diagrams.py
+# Circuit diagram PNGs for the web UI. matplotlib is imported on first use so
+# headless callers (the CLI, batch jobs) never load it.
+
+import os
+
+
+def save_circuit_diagram(qc, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from qiskit.visualization import circuit_drawer
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig = circuit_drawer(qc, output='mpl')
+    fig.savefig(path)
+    plt.close(fig)
+    return "/" + path
@@ -0,0 +1,260 @@
+# qkd_backend/qkd_runner/e91.py
+# Entanglement-based QKD (Ekert 91): a source sends one half of each
+# |Phi+> = (|00> + |11>)/sqrt(2) pair to Alice and the other to Bob. Each
+# measures along a random analyser angle (real-plane polarisation angles, as in
+# attacks.py); both give the same outcome with probability cos^2(alpha - beta).
+#
+#   Alice: 0, 22.5, 45 degrees     Bob: 22.5, 45, 67.5 degrees
+#
+# Pairs measured at the same angle (2 of 9 settings) form the key; the
+# 0/45 x 22.5/67.5 settings give the CHSH value S, which is 2*sqrt(2) for
+# perfect pairs and at most 2 once the pairs are no longer entangled.
+#
+# Settings are stored as multiples of 22.5 degrees, so sift() keeps the pairs
+# where Sender_bases == Receiver_bases. Two ways to sample the outcomes:
+#   fast  vectorized numpy from the analytic correlations, for large pair counts
+#   aer   one Aer sampler job with one circuit per setting, each run for as many
+#         shots as pairs with that setting
+# noise is a two-qubit depolarizing probability on the source in both.
+
+import logging
+
+import numpy as np
+
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.diagrams import save_circuit_diagram
+from qkd_backend.qkd_runner.exp4 import xor_encrypt_decrypt
+from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+from qkd_backend.qkd_runner.pipeline import (
+    VERIFY_TAG_BITS, cascade_correct, key_digest, privacy_amplify,
+)
+from qkd_backend.qkd_runner.qkd_logging import debug_sampled, event, get_logger
+from qkd_backend.qkd_runner.sifting import sift
+
+log = get_logger("e91")
+
+STEP = np.pi / 8                      # 22.5 degrees
+ALICE_SETTINGS = np.array([0, 1, 2])  # in units of STEP
+BOB_SETTINGS = np.array([1, 2, 3])
+EVE_SETTINGS = np.array([1, 2])       # Eve intercepts in the key bases
+# (Alice setting index, Bob setting index, sign) of the CHSH terms
+CHSH_TERMS = ((0, 0, 1), (0, 2, -1), (2, 0, 1), (2, 2, 1))
+CHSH_BOUND = 2.0
+QBER_THRESHOLD = 0.11
+METHODS = ("auto", "fast", "aer")
+AER_MAX_PAIRS = 100_000
+
+
+def _correlation(a_angle, b_angle, e_angle, noise):
+    # E = P(same) - P(different) for a |Phi+> pair. After an intercept-resend at
+    # angle e the two outcomes are only correlated through Eve's result.
+    if e_angle is None:
+        corr = np.cos(2 * (a_angle - b_angle))
+    else:
+        corr = np.cos(2 * (a_angle - e_angle)) * np.cos(2 * (b_angle - e_angle))
+    return (1 - noise) * corr
+
+
+def sample_fast(a_set, b_set, e_set, noise, rng):
+    # Alice's outcomes are uniform; Bob's agree with probability (1 + E) / 2
+    e_angle = None if e_set is None else e_set * STEP
+    corr = _correlation(a_set * STEP, b_set * STEP, e_angle, noise)
+    abits = rng.integers(0, 2, len(a_set), dtype=np.uint8)
+    flip = rng.random(len(a_set)) >= (1 + corr) / 2
+    return abits, abits ^ flip.astype(np.uint8)
+
+
+def pair_circuit(eve=False):
+    # Bell pair, optional intercept-resend of Bob's photon, then both analysers.
+    # Ry(-2 theta) maps the analyser state cos(theta)|0> + sin(theta)|1> to |0>.
+    from qiskit import QuantumCircuit
+    from qiskit.circuit import Parameter
+    alpha, beta = Parameter("alpha"), Parameter("beta")
+    qc = QuantumCircuit(2, 3 if eve else 2)
+    qc.h(0)
+    qc.cx(0, 1)
+    if eve:
+        theta_e = Parameter("eve")
+        qc.ry(-2 * theta_e, 1)
+        qc.measure(1, 2)
+        qc.ry(2 * theta_e, 1)
+    qc.ry(-2 * alpha, 0)
+    qc.ry(-2 * beta, 1)
+    qc.measure([0, 1], [0, 1])
+    return qc
+
+
+def sample_aer(a_set, b_set, e_set, noise, rng):
+    # One pub per distinct (Alice, Bob, Eve) setting with a shot per pair, all in one job
+    from qiskit_aer.noise import NoiseModel, depolarizing_error
+    from qiskit_aer.primitives import SamplerV2 as AerSampler
+
+    eve = e_set is not None
+    qc = pair_circuit(eve)
+    params = {p.name: p for p in qc.parameters}
+    settings = np.stack([a_set, b_set] + ([e_set] if eve else []), axis=1)
+    groups, group_of = np.unique(settings, axis=0, return_inverse=True)
+    group_of = group_of.ravel()
+
+    pubs = []
+    for k, setting in enumerate(groups):
+        binding = {params["alpha"]: setting[0] * STEP, params["beta"]: setting[1] * STEP}
+        if eve:
+            binding[params["eve"]] = setting[2] * STEP
+        pubs.append((qc, binding, int(np.count_nonzero(group_of == k))))
+
+    options = None
+    if noise > 0:
+        noise_model = NoiseModel()
+        noise_model.add_all_qubit_quantum_error(depolarizing_error(noise, 2), ["cx"])
+        options = {"backend_options": {"noise_model": noise_model}}
+    sampler = AerSampler(options=options, seed=int(rng.integers(2**31)))
+    results = sampler.run(pubs).result()
+
+    abits = np.empty(len(a_set), dtype=np.uint8)
+    bbits = np.empty(len(a_set), dtype=np.uint8)
+    for k, pub_result in enumerate(results):
+        # BitArray rows are big-endian: the last column is clbit 0 (Alice)
+        data = pub_result.data.c
+        bits = np.unpackbits(data.array, axis=-1)[:, -data.num_bits:]
+        idx = np.flatnonzero(group_of == k)
+        abits[idx] = bits[:, -1]
+        bbits[idx] = bits[:, -2]
+    return abits, bbits
+
+
+def chsh(abits, bbits, a_idx, b_idx):
+    # S = E(a1, b1) - E(a1, b3) + E(a3, b1) + E(a3, b3) from the non-key settings,
+    # with its standard error from the binomial spread of each correlation
+    same = abits == bbits
+    s, var, correlations = 0.0, 0.0, {}
+    for i, j, sign in CHSH_TERMS:
+        mask = (a_idx == i) & (b_idx == j)
+        n = int(np.count_nonzero(mask))
+        if n == 0:
+            return {"S": None, "S_std": None, "correlations": correlations, "violated": False}
+        e = float(2 * np.count_nonzero(same[mask]) / n - 1)
+        correlations[f"{ALICE_SETTINGS[i] * 22.5:g},{BOB_SETTINGS[j] * 22.5:g}"] = e
+        s += sign * e
+        var += (1 - e * e) / n
+    return {"S": s, "S_std": var ** 0.5, "correlations": correlations, "violated": bool(s > CHSH_BOUND)}
+
+
+@metrics.instrument("e91")
+def run_e91(message=None, n_pairs=1000, noise=0.0, eve=False, method="auto",
+            rng_seed=None, test_fraction=0.25, diagram=True):
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', choose from {METHODS}")
+    if not 0 <= noise <= 1:
+        raise ValueError("noise must be between 0 and 1")
+    if n_pairs < 1:
+        raise ValueError("n_pairs must be at least 1")
+    if method == "aer" and n_pairs > AER_MAX_PAIRS:
+        raise ValueError(f"The aer method simulates at most {AER_MAX_PAIRS} pairs, use fast")
+    if method == "auto":
+        method = "aer" if n_pairs <= AER_MAX_PAIRS else "fast"
+    rng = np.random.default_rng(rng_seed)
+
+    with metrics.span("e91", "circuit"):
+        # Random analyser settings for every pair (and Eve's, when she intercepts)
+        a_idx = rng.integers(0, 3, n_pairs)
+        b_idx = rng.integers(0, 3, n_pairs)
+        a_set = ALICE_SETTINGS[a_idx]
+        b_set = BOB_SETTINGS[b_idx]
+        e_set = EVE_SETTINGS[rng.integers(0, 2, n_pairs)] if eve else None
+
+    diagram_url = None
+    if diagram:
+        with metrics.span("e91", "diagram"):
+            diagram_url = save_circuit_diagram(pair_circuit(eve), "static/circuit_e91.png")
+
+    with metrics.span("e91", "simulate"):
+        sample = sample_aer if method == "aer" else sample_fast
+        abits, bbits = sample(a_set, b_set, e_set, noise, rng)
+
+    with metrics.span("e91", "postprocess"):
+        bell = chsh(abits, bbits, a_idx, b_idx)
+
+        # Sifting: pairs measured at the same angle
+        agoodbits, bgoodbits, _, _ = sift(abits, a_set, b_set, bbits)
+
+        # Parameter estimation: QBER from a sacrificed random subset, the rest stays secret
+        estimate = estimate_qber(agoodbits, bgoodbits, test_fraction, rng)
+        agoodbits = estimate["agoodbits"]
+        bgoodbits = estimate["bgoodbits"]
+        fidelity = 1 - estimate["qber"] if estimate["test_samples"] else 0
+        loss = estimate["qber"] if estimate["test_samples"] else 1
+        debug_sampled(log, "sifted", lambda: {
+            "n_pairs": n_pairs, "sifted_bits": len(agoodbits) + estimate["test_samples"],
+            "test_samples": estimate["test_samples"], "S": bell["S"]})
+
+        # Security check: the pairs must still violate CHSH, and the QBER's upper
+        # confidence bound (not the point estimate) must allow a key
+        abort_reason = None
+        if not bell["violated"]:
+            abort_reason = "No CHSH violation (S <= 2): pairs not entangled, key generation aborted."
+        elif loss > QBER_THRESHOLD:
+            abort_reason = "Error too high! Key generation aborted."
+        elif estimate["qber_ci"][1] > QBER_THRESHOLD:
+            abort_reason = "Too few test bits to bound the error below 11%. Key generation aborted."
+
+        error_corrected_key = ""
+        secret_key = ""
+        corrected_bbits = []
+        if abort_reason is None:
+            corrected, leaked = cascade_correct(agoodbits, bgoodbits, rng=rng)
+            # Both sides compare a short hash before any key is reported; it is disclosed too
+            if key_digest(agoodbits) != key_digest(corrected):
+                abort_reason = "Error correction left Alice's and Bob's keys different. Key generation aborted."
+            else:
+                leaked += VERIFY_TAG_BITS
+                secret_key = privacy_amplify(corrected, estimate["qber_ci"][1], leaked).hex()
+                corrected_bbits = corrected.tolist()
+                error_corrected_key = "".join(map(str, corrected_bbits))
+
+        if message is None:
+            message = "QKD demo"
+        if len(corrected_bbits) >= 8:
+            encrypted_bytes = xor_encrypt_decrypt(message.encode("utf-8"), agoodbits)
+            decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, corrected_bbits)
+            try:
+                decrypted_message = decrypted_bytes.decode("utf-8")
+            except Exception:
+                decrypted_message = "<decryption failed>"
+            encrypted_hex = encrypted_bytes.hex()
+        else:
+            encrypted_hex = ""
+            decrypted_message = ""
+
+        # Joint outcomes in Qiskit's key order: Bob's bit (clbit 1), then Alice's (clbit 0)
+        joint = np.bincount(2 * bbits + abits, minlength=4)
+        counts = {f"{k:02b}": int(v) for k, v in enumerate(joint) if v}
+
+    metrics.record_run("e91", qber=loss, sifted_length=len(agoodbits),
+                       key_bits=len(corrected_bbits), qubits=n_pairs)
+    event(log, logging.WARNING if abort_reason else logging.INFO, "run_complete",
+          n_pairs=n_pairs, method=method, sifted_bits=len(agoodbits), qber=loss,
+          S=bell["S"], aborted=abort_reason is not None)
+
+    return {
+        "Sender_bits": abits.tolist(),
+        "Sender_bases": a_set.tolist(),
+        "Receiver_bases": b_set.tolist(),
+        "Receiver_bits": bbits.tolist(),
+        "agoodbits": agoodbits,
+        "bgoodbits": bgoodbits,
+        "fidelity": fidelity,
+        "loss": loss,
+        "qber_ci": estimate["qber_ci"],
+        "test_indices": estimate["test_indices"],
+        "error_corrected_key": error_corrected_key,
+        "final_secret_key": secret_key,
+        "original_message": message,
+        "encrypted_message_hex": encrypted_hex,
+        "decrypted_message": decrypted_message,
+        "circuit_diagram_url": diagram_url,
+        "counts": counts,
+        "chsh": bell,
+        "method": method,
+        "abort_reason": abort_reason,
+    }
@@ -0,0 +1,169 @@
+# qkd_backend/qkd_runner/encoding.py
+# Compact result encoding for high-rate clients, negotiated per request:
+#
+#   Accept: application/json (default)        unchanged result dict
+#   Accept: application/vnd.qkd.compact+json   compact form as JSON, gzipped when
+#                                              Accept-Encoding allows it
+#   Accept: application/msgpack                compact form as msgpack (needs msgpack)
+#
+# Compact form: bit arrays become {"$bits": base64 packed bits, "n": length},
+# counts dicts become parallel arrays {"$counts": base64 packed outcome rows,
+# "width": bits per outcome, "values": [...]}, and lists of records (steps)
+# become columns {"$table": {column: [...]}}. decode() restores the plain form,
+# with bit arrays as lists of ints.
+
+import base64
+import gzip
+import json
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.qkd.compact+json"
+MSGPACK = "application/msgpack"
+GZIP_MIN_BYTES = 1024
+
+BIT_FIELDS = frozenset({
+    "Sender_bits", "Sender_bases", "Receiver_bases", "Receiver_bits",
+    "agoodbits", "bgoodbits", "Eve_bases", "Eve_bits",
+})
+COUNT_FIELDS = frozenset({"counts", "counts_eve", "counts_bob"})
+TABLE_FIELDS = frozenset({"steps"})
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def pack_bits(bits):
+    bits = np.asarray(bits).astype(np.uint8, copy=False)
+    return {"$bits": _b64(np.packbits(bits).tobytes()), "n": int(bits.size)}
+
+
+def unpack_bits(packed):
+    raw = np.frombuffer(base64.b64decode(packed["$bits"]), dtype=np.uint8)
+    return np.unpackbits(raw, count=packed["n"]).tolist()
+
+
+def pack_counts(counts):
+    # Qiskit bitstring keys -> packed rows of `width` bits, one per outcome
+    keys = list(counts)
+    if not keys:
+        return counts
+    width = len(keys[0])
+    # Multi-register keys ("01 10") or ragged widths stay as a plain dict
+    if any(len(k) != width for k in keys) or set("".join(keys)) - {"0", "1"}:
+        return counts
+    rows = np.frombuffer("".join(keys).encode("ascii"), dtype=np.uint8) - ord("0")
+    return {
+        "$counts": _b64(np.packbits(rows.reshape(len(keys), width), axis=1).tobytes()),
+        "width": width,
+        "values": [int(v) for v in counts.values()],
+    }
+
+
+def unpack_counts(packed):
+    width, values = packed["width"], packed["values"]
+    raw = np.frombuffer(base64.b64decode(packed["$counts"]), dtype=np.uint8)
+    rows = np.unpackbits(raw.reshape(len(values), -1), axis=1, count=width)
+    keys = (rows + ord("0")).astype(np.uint8).tobytes().decode("ascii")
+    return {keys[i * width:(i + 1) * width]: v for i, v in enumerate(values)}
+
+
+def pack_table(records):
+    if not records or not all(isinstance(r, dict) for r in records):
+        return records
+    columns = list(records[0])
+    if any(list(r) != columns for r in records):
+        return records
+    return {"$table": {c: [r[c] for r in records] for c in columns}}
+
+
+def unpack_table(packed):
+    columns = packed["$table"]
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[c] for c in names))]
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _is_bits(values):
+    # E91 bases are analyser settings 0-3, not bits; those lists stay as they are
+    values = np.asarray(values)
+    return values.dtype != object and bool(((values == 0) | (values == 1)).all())
+
+
+def compact(result):
+    # Only the known fields are rewritten, so numeric lists like distances are never mistaken for bits
+    if isinstance(result, list):
+        return [compact(r) for r in result]
+    if not isinstance(result, dict):
+        return _plain(result)
+    out = {}
+    for key, value in result.items():
+        value = _plain(value)
+        if key in BIT_FIELDS and isinstance(value, list) and _is_bits(value):
+            out[key] = pack_bits(value)
+        elif key in COUNT_FIELDS and isinstance(value, dict):
+            out[key] = pack_counts(value)
+        elif key in TABLE_FIELDS and isinstance(value, list):
+            out[key] = pack_table(value)
+        elif isinstance(value, (dict, list)):
+            out[key] = compact(value)
+        else:
+            out[key] = value
+    return out
+
+
+def decode(obj):
+    # Inverse of compact(); plain results pass through unchanged
+    if isinstance(obj, list):
+        return [decode(v) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if "$bits" in obj:
+        return unpack_bits(obj)
+    if "$counts" in obj:
+        return unpack_counts(obj)
+    if "$table" in obj:
+        return unpack_table(obj)
+    return {k: decode(v) for k, v in obj.items()}
+
+
+def encode_response(result, accept_mimetype, accept_gzip=False):
+    # Returns (body bytes, content type, extra headers) for the negotiated format
+    if accept_mimetype == MSGPACK and msgpack is not None:
+        return msgpack.packb(compact(result), use_bin_type=True), MSGPACK, {}
+    if accept_mimetype == COMPACT_JSON:
+        body = json.dumps(compact(result), separators=(",", ":")).encode("utf-8")
+        if accept_gzip and len(body) >= GZIP_MIN_BYTES:
+            return gzip.compress(body, compresslevel=5), COMPACT_JSON, {"Content-Encoding": "gzip"}
+        return body, COMPACT_JSON, {}
+    return json.dumps(result).encode("utf-8"), JSON, {}
+
+
+def supported_mimetypes():
+    # In preference order for content negotiation; plain JSON first so */* keeps the old format
+    return [JSON, COMPACT_JSON] + ([MSGPACK] if msgpack is not None else [])
+
+
+def decode_response(body, content_type=JSON):
+    # Client side: body may still be gzipped if the HTTP client did not inflate it
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    if content_type.split(";")[0].strip() == MSGPACK:
+        if msgpack is None:
+            raise ImportError("msgpack is required to decode application/msgpack responses")
+        return decode(msgpack.unpackb(body, raw=False))
+    return decode(json.loads(body))
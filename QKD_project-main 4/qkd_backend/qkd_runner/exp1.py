@@ -1,83 +1,79 @@
 # qkd_backend/qkd_runner/exp1.py
+import logging
+
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.qkd_logging import debug_sampled, event, get_logger
+
+log = get_logger("exp1")
+
 def xor_encrypt_decrypt(message_bytes, key_bits):
     # Repeat key_bits to match the length of message_bytes
     key = (key_bits * ((len(message_bytes) // len(key_bits)) + 1))[:len(message_bytes)]
     key_bytes = bytes([int(b) for b in key])
     return bytes([mb ^ kb for mb, kb in zip(message_bytes, key_bytes)])
-def run_exp1(message=None):
+@metrics.instrument("exp1")
+def run_exp1(message=None, bit_num=20, test_fraction=0.25):
     # Qiskit patterns step 1: Map your problem to quantum circuit
     # Import some generic packages
     import numpy as np
     from qiskit import QuantumCircuit
-    import matplotlib.pyplot as plt 
     from io import BytesIO
     import os
     import hashlib
-    from qiskit.visualization import circuit_drawer
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-
-    # Set up a random number generator and a quantum circuit. 
-    rng = np.random.default_rng()
-    bit_num = 20
-    qc = QuantumCircuit(bit_num, bit_num)
 
-    # QKD step 1: Random bits and bases for Sender
-    abits = np.round(rng.random(bit_num))
-    abase = np.round(rng.random(bit_num))
+    with metrics.span("exp1", "circuit"):
+        # Set up a random number generator and a quantum circuit. 
+        rng = np.random.default_rng()
+        qc = QuantumCircuit(bit_num, bit_num)
 
-    for n in range(bit_num):
-        if abits[n] == 0:
-            if abase[n] == 1:
-                qc.h(n)
-        if abits[n] == 1:
-            if abase[n] == 0:
-                qc.x(n)
-            if abase[n] == 1:
-                qc.x(n)
-                qc.h(n)
+        # QKD step 1: Random bits and bases for Sender
+        abits = np.round(rng.random(bit_num))
+        abase = np.round(rng.random(bit_num))
 
-    qc.barrier()
+        for n in range(bit_num):
+            if abits[n] == 0:
+                if abase[n] == 1:
+                    qc.h(n)
+            if abits[n] == 1:
+                if abase[n] == 0:
+                    qc.x(n)
+                if abase[n] == 1:
+                    qc.x(n)
+                    qc.h(n)
 
-    # QKD step 2: Random bases for Receiver
-    bbase = np.round(rng.random(bit_num))
+        qc.barrier()
 
-    for m in range(bit_num):
-        if bbase[m] == 1:
-            qc.h(m)
-        qc.measure(m, m)
+        # QKD step 2: Random bases for Receiver
+        bbase = np.round(rng.random(bit_num))
 
-    print("Sender's bits are ", abits)
-    print("Sender's bases are ", abase)
-    print("Receiver's bases are ", bbase)
+        for m in range(bit_num):
+            if bbase[m] == 1:
+                qc.h(m)
+            qc.measure(m, m)
 
-    
+    # Bases are public after sifting; Sender's bits are not, so only their count is logged
+    debug_sampled(log, "prepared", lambda: {
+        "bit_num": bit_num, "basis_matches": int((abase == bbase).sum())})
 
-    from qiskit_ibm_runtime import QiskitRuntimeService
-    service = QiskitRuntimeService()
-    backend = service.backend("ibm_brisbane")
-    print(backend.name)
+    from qkd_backend.qkd_runner.backends import get_backend, get_pass_manager, get_simulator
+    backend = get_backend()
 
     from qiskit.primitives import BackendSamplerV2
-    from qiskit_aer import AerSimulator
-    from qiskit_aer.noise import NoiseModel
     from qiskit_ibm_runtime import SamplerV2 as Sampler
-    from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 
-    noise_model = NoiseModel.from_backend(backend)
-    backend_sim = AerSimulator(noise_model=noise_model)
-    sampler_sim = BackendSamplerV2(backend=backend_sim)
+    with metrics.span("exp1", "noise_model"):
+        # Noise model and simulator are built once per process (see backends.warmup)
+        sampler_sim = BackendSamplerV2(backend=get_simulator(noisy=True))
 
-    target = backend.target
-    pm = generate_preset_pass_manager(target=target, optimization_level=3)
-    qc_isa = pm.run(qc)
+    with metrics.span("exp1", "transpile"):
+        qc_isa = get_pass_manager().run(qc)
 
-    sampler = Sampler(mode=backend)
-    job = sampler.run([qc_isa], shots=1024)
+    with metrics.span("exp1", "sampler"):
+        sampler = Sampler(mode=backend)
+        job = sampler.run([qc_isa], shots=1024)
 
-    counts = job.result()[0].data.c.get_counts()
-    countsint = job.result()[0].data.c.get_int_counts()
+        counts = job.result()[0].data.c.get_counts()
+        countsint = job.result()[0].data.c.get_int_counts()
 
     keys = counts.keys()
     key = list(keys)[0]
@@ -87,68 +83,66 @@ def run_exp1(message=None):
         bmeas_ints.append(int(bmeas[n]))
     bbits = bmeas_ints[::-1]
 
-    print(bbits)
-
-    # QKD step 3: Public discussion of bases
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for n in range(bit_num):
-        if abase[n] == bbase[n]:
-            agoodbits.append(int(abits[n]))
-            bgoodbits.append(bbits[n])
-            if int(abits[n]) == bbits[n]:
-                match_count += 1
-    import hashlib
-
-# --- Error Correction (Simple Parity) ---
-    block_size = 4  # adjust as needed
-    corrected_bbits = []
-
-    for i in range(0, len(agoodbits), block_size):
-        a_block = agoodbits[i:i+block_size]
-        b_block = bgoodbits[i:i+block_size]
-
-    # Compute parity
-        a_parity = sum(a_block) % 2
-        b_parity = sum(b_block) % 2
-
-    # If parity differs, flip last bit in Bob's block
-    if a_parity != b_parity and len(b_block) > 0:
-        b_block[-1] ^= 1  # flip last bit
-
-    corrected_bbits.extend(b_block)
-
-    print(agoodbits)
-    print(bgoodbits)
-    print("fidelity = ", match_count / len(agoodbits))
-    print("loss = ", 1 - match_count / len(agoodbits))
-    error_corrected_key = ''.join(map(str, corrected_bbits))
-    print("Key after Error Correction:", error_corrected_key)
-
-    # --- Privacy Amplification ---
-    secret_key = hashlib.sha256(error_corrected_key.encode()).hexdigest()
-    secret_key = secret_key[:64]  # shorten for demonstration
-
-    print("Final Secret Key:", secret_key)
-
-    # --- Message encryption/decryption ---
-    if message is None:
-        message = "QKD demo"
-    message_bytes = message.encode('utf-8')
-    if agoodbits and len(agoodbits) >= 8:
-        # Encrypt
-        encrypted_bytes = xor_encrypt_decrypt(message_bytes, agoodbits)
-        # Decrypt using Bob's key
-        decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, bgoodbits)
-        try:
-            decrypted_message = decrypted_bytes.decode('utf-8')
-        except Exception:
-            decrypted_message = "<decryption failed>"
-        encrypted_hex = encrypted_bytes.hex()
-    else:
-        encrypted_hex = ""
-        decrypted_message = ""
+    with metrics.span("exp1", "postprocess"):
+        # QKD step 3: Public discussion of bases
+        from qkd_backend.qkd_runner.sifting import sift
+        agoodbits, bgoodbits, _, _ = sift(abits, abase, bbase, bbits)
+
+        # Parameter estimation: QBER from a sacrificed random subset, the rest stays secret
+        from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+        estimate = estimate_qber(agoodbits, bgoodbits, test_fraction, rng)
+        agoodbits = estimate["agoodbits"]
+        bgoodbits = estimate["bgoodbits"]
+        fidelity = 1 - estimate["qber"] if estimate["test_samples"] else 0
+        loss = estimate["qber"] if estimate["test_samples"] else 1
+
+        # --- Error Correction (Simple Parity) ---
+        block_size = 4  # adjust as needed
+        corrected_bbits = []
+
+        for i in range(0, len(agoodbits), block_size):
+            a_block = agoodbits[i:i+block_size]
+            b_block = bgoodbits[i:i+block_size]
+
+            # Compute parity
+            a_parity = sum(a_block) % 2
+            b_parity = sum(b_block) % 2
+
+            # If parity differs, flip last bit in Bob's block
+            if a_parity != b_parity and len(b_block) > 0:
+                b_block[-1] ^= 1  # flip last bit
+
+            corrected_bbits.extend(b_block)
+
+        error_corrected_key = ''.join(map(str, corrected_bbits))
+
+        # --- Privacy Amplification ---
+        secret_key = hashlib.sha256(error_corrected_key.encode()).hexdigest()
+        secret_key = secret_key[:64]  # shorten for demonstration
+
+        # --- Message encryption/decryption ---
+        if message is None:
+            message = "QKD demo"
+        message_bytes = message.encode('utf-8')
+        if agoodbits and len(agoodbits) >= 8:
+            # Encrypt
+            encrypted_bytes = xor_encrypt_decrypt(message_bytes, agoodbits)
+            # Decrypt using Bob's key
+            decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, bgoodbits)
+            try:
+                decrypted_message = decrypted_bytes.decode('utf-8')
+            except Exception:
+                decrypted_message = "<decryption failed>"
+            encrypted_hex = encrypted_bytes.hex()
+        else:
+            encrypted_hex = ""
+            decrypted_message = ""
+
+    metrics.record_run("exp1", qber=loss, sifted_length=len(agoodbits),
+                       key_bits=len(corrected_bbits), qubits=bit_num)
+    event(log, logging.INFO, "run_complete", backend=backend.name, bit_num=bit_num,
+          sifted_bits=len(agoodbits), key_bits=len(corrected_bbits),
+          fidelity=fidelity, qber=loss)
 
     # Return results as string for UI
     return {
@@ -158,8 +152,10 @@ def run_exp1(message=None):
         "Receiver_bits": bbits,
         "agoodbits": agoodbits,
         "bgoodbits": bgoodbits,
-        "fidelity": match_count / len(agoodbits),
-        "loss": 1 - match_count / len(agoodbits),
+        "fidelity": fidelity,
+        "loss": loss,
+        "qber_ci": estimate["qber_ci"],
+        "test_indices": estimate["test_indices"],
          "error_corrected_key": error_corrected_key,
         "final_secret_key": secret_key,
         "original_message": message,
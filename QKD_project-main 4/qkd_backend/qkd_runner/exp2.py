@@ -2,19 +2,18 @@
 
 import numpy as np
 from qiskit import QuantumCircuit
-from qiskit_ibm_runtime import QiskitRuntimeService, SamplerV2 as Sampler
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qiskit_ibm_runtime import SamplerV2 as Sampler
+import logging
 import os
 import hashlib
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+from qkd_backend.qkd_runner.sifting import sift
+from qkd_backend.qkd_runner.backends import get_backend, get_pass_manager
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.diagrams import save_circuit_diagram
+from qkd_backend.qkd_runner.qkd_logging import debug_sampled, event, get_logger
 
-
-service = QiskitRuntimeService()
-backend = service.backend("ibm_brisbane")
-print(backend.name)
+log = get_logger("exp2")
 
 def xor_encrypt_decrypt(message_bytes, key_bits):
     # message_bytes: bytes
@@ -42,7 +41,10 @@ def xor_encrypt_decrypt(message_bytes, key_bits):
         cipher_bytes.append(byte)
     return bytes(cipher_bytes)
 
-def run_exp2(message=None, bit_num=20, shots=1024, rng_seed=None):
+@metrics.instrument("exp2")
+def run_exp2(message=None, bit_num=20, shots=1024, rng_seed=None, test_fraction=0.25, diagram=True):
+    # Looked up per run (cached in backends), so importing this module never contacts IBM
+    backend = get_backend()
     rng = np.random.default_rng(rng_seed)
 
     # Step 1: Sender's random bits and bases
@@ -52,112 +54,109 @@ def run_exp2(message=None, bit_num=20, shots=1024, rng_seed=None):
     # Step 2: Receiver's random measurement bases
     bbase = np.round(rng.random(bit_num))
 
-    # Sender prepares and sends qubits
-    qc = QuantumCircuit(bit_num, bit_num)
-    for n in range(bit_num):
-        if abits[n] == 0:
-            if abase[n] == 1:
-                qc.h(n)
-        if abits[n] == 1:
-            if abase[n] == 0:
-                qc.x(n)
-            if abase[n] == 1:
-                qc.x(n)
-                qc.h(n)
-
-    # Receiver's measurement
-    for m in range(bit_num):
-        if bbase[m] == 1:
-            qc.h(m)
-        qc.measure(m, m)
+    with metrics.span("exp2", "circuit"):
+        # Sender prepares and sends qubits
+        qc = QuantumCircuit(bit_num, bit_num)
+        for n in range(bit_num):
+            if abits[n] == 0:
+                if abase[n] == 1:
+                    qc.h(n)
+            if abits[n] == 1:
+                if abase[n] == 0:
+                    qc.x(n)
+                if abase[n] == 1:
+                    qc.x(n)
+                    qc.h(n)
+
+        # Receiver's measurement
+        for m in range(bit_num):
+            if bbase[m] == 1:
+                qc.h(m)
+            qc.measure(m, m)
 
     # Transpile for backend
-    target = backend.target
-    pm = generate_preset_pass_manager(target=target, optimization_level=3)
-    qc_isa = pm.run(qc)
-    diagram_path = "static/circuit_exp2.svg"
-    import matplotlib.pyplot as plt
-    os.makedirs("static", exist_ok=True)
-    diagram_path = "static/circuit_exp2.png"
-    fig = circuit_drawer(qc_isa, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
+    with metrics.span("exp2", "transpile"):
+        pm = get_pass_manager()
+        qc_isa = pm.run(qc)
+    # Diagram rendering (matplotlib) is skipped for headless runs
+    diagram_url = None
+    if diagram:
+        with metrics.span("exp2", "diagram"):
+            diagram_url = save_circuit_diagram(qc_isa, "static/circuit_exp2.png")
 
     # Run on IBM Quantum backend using SamplerV2
-    sampler = Sampler(mode=backend)
-    job = sampler.run([qc_isa], shots=1024)
-    counts = job.result()[0].data.c.get_counts()
+    with metrics.span("exp2", "sampler"):
+        sampler = Sampler(mode=backend)
+        job = sampler.run([qc_isa], shots=1024)
+        counts = job.result()[0].data.c.get_counts()
     key = list(counts.keys())[0]
     bmeas = list(key)
     bbits = [int(x) for x in bmeas][::-1]
 
-    # Sifting: keep only positions where Sender & Receiver used same basis
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for i in range(bit_num):
-        if abase[i] == bbase[i]:
-            agoodbits.append(int(abits[i]))
-            bgoodbits.append(int(bbits[i]))
-            if int(abits[i]) == int(bbits[i]):
-                match_count += 1
-
-    fidelity = match_count / len(agoodbits) if agoodbits else 0
-    loss = 1 - fidelity if agoodbits else 1
-
-    diagram_path = "static/circuit_exp2.png"
-    fig = circuit_drawer(qc_isa, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
-        # --- Error Correction (Simple Parity) ---
-    block_size = 4  # adjust as needed
-    corrected_bbits = []
-
-    for i in range(0, len(agoodbits), block_size):
-        a_block = agoodbits[i:i+block_size]
-        b_block = bgoodbits[i:i+block_size]
-
-        # Compute parity
-        a_parity = sum(a_block) % 2
-        b_parity = sum(b_block) % 2
+    with metrics.span("exp2", "postprocess"):
+        # Sifting: keep only positions where Sender & Receiver used same basis
+        agoodbits, bgoodbits, _, _ = sift(abits, abase, bbase, bbits)
 
-        # If parity differs, flip last bit in Bob's block
-        if a_parity != b_parity and len(b_block) > 0:
-            b_block[-1] ^= 1  # flip last bit
+        # Parameter estimation: QBER from a sacrificed random subset, the rest stays secret
+        estimate = estimate_qber(agoodbits, bgoodbits, test_fraction, rng)
+        agoodbits = estimate["agoodbits"]
+        bgoodbits = estimate["bgoodbits"]
+        fidelity = 1 - estimate["qber"] if estimate["test_samples"] else 0
+        loss = estimate["qber"] if estimate["test_samples"] else 1
+        debug_sampled(log, "sifted", lambda: {
+            "bit_num": bit_num, "sifted_bits": len(agoodbits) + estimate["test_samples"],
+            "test_samples": estimate["test_samples"], "test_errors": estimate["test_errors"]})
 
-        corrected_bbits.extend(b_block)
-
-    # Display key after error correction
-    error_corrected_key = ''.join(map(str, corrected_bbits))
-    print("Key after Error Correction:", error_corrected_key)
-
-    # --- Privacy Amplification ---
-    secret_key = hashlib.sha256(error_corrected_key.encode()).hexdigest()
-    secret_key = secret_key[:64]  # shorten for demonstration
-
-    print("Final Secret Key:", secret_key)
-
-    # --- Message encryption/decryption ---
-    if message is None:
-        message = "QKD demo"
-    message_bytes = message.encode('utf-8')
-    if agoodbits and len(agoodbits) >= 8:
-        # Encrypt
-        encrypted_bytes = xor_encrypt_decrypt(message_bytes, agoodbits)
-        # Decrypt using Bob's key
-        decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, bgoodbits)
-        try:
-            decrypted_message = decrypted_bytes.decode('utf-8')
-        except Exception:
-            decrypted_message = "<decryption failed>"
-        encrypted_hex = encrypted_bytes.hex()
-    else:
-        encrypted_hex = ""
-        decrypted_message = ""
+        # --- Error Correction (Simple Parity) ---
+        block_size = 4  # adjust as needed
+        corrected_bbits = []
+
+        for i in range(0, len(agoodbits), block_size):
+            a_block = agoodbits[i:i+block_size]
+            b_block = bgoodbits[i:i+block_size]
+
+            # Compute parity
+            a_parity = sum(a_block) % 2
+            b_parity = sum(b_block) % 2
+
+            # If parity differs, flip last bit in Bob's block
+            if a_parity != b_parity and len(b_block) > 0:
+                b_block[-1] ^= 1  # flip last bit
+
+            corrected_bbits.extend(b_block)
+
+        # Key after error correction
+        error_corrected_key = ''.join(map(str, corrected_bbits))
+
+        # --- Privacy Amplification ---
+        secret_key = hashlib.sha256(error_corrected_key.encode()).hexdigest()
+        secret_key = secret_key[:64]  # shorten for demonstration
+
+        # --- Message encryption/decryption ---
+        if message is None:
+            message = "QKD demo"
+        message_bytes = message.encode('utf-8')
+        if agoodbits and len(agoodbits) >= 8:
+            # Encrypt
+            encrypted_bytes = xor_encrypt_decrypt(message_bytes, agoodbits)
+            # Decrypt using Bob's key
+            decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, bgoodbits)
+            try:
+                decrypted_message = decrypted_bytes.decode('utf-8')
+            except Exception:
+                decrypted_message = "<decryption failed>"
+            encrypted_hex = encrypted_bytes.hex()
+        else:
+            encrypted_hex = ""
+            decrypted_message = ""
     counts = job.result()[0].data.c.get_counts()
     key = list(counts.keys())[0]
     bmeas = list(key)
     bbits = [int(x) for x in bmeas][::-1]
+    metrics.record_run("exp2", qber=loss, sifted_length=len(agoodbits),
+                       key_bits=len(corrected_bbits), qubits=bit_num)
+    event(log, logging.INFO, "run_complete", backend=backend.name, bit_num=bit_num,
+          sifted_bits=len(agoodbits), key_bits=len(corrected_bbits), qber=loss)
     
     return {
         "Sender_bits": abits.tolist(),
@@ -168,12 +167,14 @@ def run_exp2(message=None, bit_num=20, shots=1024, rng_seed=None):
         "bgoodbits": bgoodbits,
         "fidelity": fidelity,
         "loss": loss,
+        "qber_ci": estimate["qber_ci"],
+        "test_indices": estimate["test_indices"],
         "error_corrected_key": error_corrected_key,
         "final_secret_key": secret_key,
         "original_message": message,
         "encrypted_message_hex": encrypted_hex,
         "decrypted_message": decrypted_message,
-        "circuit_diagram_url": "/static/circuit_exp2.png",
+        "circuit_diagram_url": diagram_url,
         "counts": counts # <-- add this line,
         
         
@@ -3,21 +3,24 @@
 
 import numpy as np
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
-from qiskit_ibm_runtime import QiskitRuntimeService, SamplerV2 as Sampler
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qiskit_ibm_runtime import SamplerV2 as Sampler
+import logging
 import os
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
-
-# Login: make sure you've done `qiskit-ibm-runtime login --token YOUR_API_KEY`
-service = QiskitRuntimeService()
-backend = service.backend("ibm_brisbane")
-print(backend.name)
-
-def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None):
+from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+from qkd_backend.qkd_runner.sifting import sift
+from qkd_backend.qkd_runner.backends import get_backend, get_pass_manager
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.diagrams import save_circuit_diagram
+from qkd_backend.qkd_runner.qkd_logging import debug_sampled, event, get_logger
+
+log = get_logger("exp3")
+
+@metrics.instrument("exp3")
+def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None, test_fraction=0.25, diagram=True):
+    # Login: make sure you've done `qiskit-ibm-runtime login --token YOUR_API_KEY`
+    # (or set QKD_BACKEND=fake_brisbane to run against the local noisy snapshot).
+    # Looked up per run (cached in backends), so importing this module never contacts IBM
+    backend = get_backend()
     rng = np.random.default_rng(rng_seed)
 
     # Step 1: Sender's random bits and bases
@@ -30,93 +33,104 @@ def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None):
     # Step 3: Receiver's random measurement bases
     bbase = np.round(rng.random(bit_num))
 
-    # --- Sender prepares and sends qubits ---
-    qr = QuantumRegister(bit_num, "q")
-    cr = ClassicalRegister(bit_num, "c")
-    qc = QuantumCircuit(qr, cr)
-    for n in range(bit_num):
-        if abits[n] == 0:
-            if abase[n] == 1:
-                qc.h(n)
-        if abits[n] == 1:
-            if abase[n] == 0:
-                qc.x(n)
-            if abase[n] == 1:
-                qc.x(n)
-                qc.h(n)
-
-    # --- Eve intercepts and measures ---
-    for m in range(bit_num):
-        if ebase[m] == 1:
-            qc.h(m)
-        qc.measure(qr[m], cr[m])
+    with metrics.span("exp3", "circuit"):
+        # --- Sender prepares and sends qubits ---
+        qr = QuantumRegister(bit_num, "q")
+        cr = ClassicalRegister(bit_num, "c")
+        qc = QuantumCircuit(qr, cr)
+        for n in range(bit_num):
+            if abits[n] == 0:
+                if abase[n] == 1:
+                    qc.h(n)
+            if abits[n] == 1:
+                if abase[n] == 0:
+                    qc.x(n)
+                if abase[n] == 1:
+                    qc.x(n)
+                    qc.h(n)
+
+        # --- Eve intercepts and measures ---
+        for m in range(bit_num):
+            if ebase[m] == 1:
+                qc.h(m)
+            qc.measure(qr[m], cr[m])
 
     # Transpile for backend
-    target = backend.target
-    pm = generate_preset_pass_manager(target=target, optimization_level=3)
-    qc_isa = pm.run(qc)
+    with metrics.span("exp3", "transpile"):
+        pm = get_pass_manager()
+        qc_isa = pm.run(qc)
 
     # Eve's measurement using SamplerV2
-    sampler = Sampler(mode=backend)
-    job = sampler.run([qc_isa], shots=1024)
-    counts = job.result()[0].data.c.get_counts()
+    with metrics.span("exp3", "sampler"):
+        sampler = Sampler(mode=backend)
+        job = sampler.run([qc_isa], shots=1024)
+        counts = job.result()[0].data.c.get_counts()
     key = list(counts.keys())[0]
     emeas = list(key)
     ebits = [int(x) for x in emeas][::-1]
 
-    # --- Eve resends to Receiver ---
-    qr2 = QuantumRegister(bit_num, "q")
-    cr2 = ClassicalRegister(bit_num, "c")
-    qc2 = QuantumCircuit(qr2, cr2)
-    for n in range(bit_num):
-        if ebits[n] == 0:
-            if ebase[n] == 1:
-                qc2.h(n)
-        if ebits[n] == 1:
-            if ebase[n] == 0:
-                qc2.x(n)
-            if ebase[n] == 1:
-                qc2.x(n)
-                qc2.h(n)
-
-    # Receiver's measurement
-    for m in range(bit_num):
-        if bbase[m] == 1:
-            qc2.h(m)
-        qc2.measure(qr2[m], cr2[m])
-
-    qc2_isa = pm.run(qc2)
-    job2 = sampler.run([qc2_isa], shots=1024)
-    counts2 = job2.result()[0].data.c.get_counts()
+    with metrics.span("exp3", "circuit"):
+        # --- Eve resends to Receiver ---
+        qr2 = QuantumRegister(bit_num, "q")
+        cr2 = ClassicalRegister(bit_num, "c")
+        qc2 = QuantumCircuit(qr2, cr2)
+        for n in range(bit_num):
+            if ebits[n] == 0:
+                if ebase[n] == 1:
+                    qc2.h(n)
+            if ebits[n] == 1:
+                if ebase[n] == 0:
+                    qc2.x(n)
+                if ebase[n] == 1:
+                    qc2.x(n)
+                    qc2.h(n)
+
+        # Receiver's measurement
+        for m in range(bit_num):
+            if bbase[m] == 1:
+                qc2.h(m)
+            qc2.measure(qr2[m], cr2[m])
+
+    with metrics.span("exp3", "transpile"):
+        qc2_isa = pm.run(qc2)
+    with metrics.span("exp3", "sampler"):
+        job2 = sampler.run([qc2_isa], shots=1024)
+        counts2 = job2.result()[0].data.c.get_counts()
     key2 = list(counts2.keys())[0]
     bmeas = list(key2)
     bbits = [int(x) for x in bmeas][::-1]
     
 
-    diagram_path = "static/circuit_exp3.png"
-    fig = circuit_drawer(qc2_isa, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
-
-    # Sifting: keep only positions where Sender & Receiver used same basis
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for i in range(bit_num):
-        if abase[i] == bbase[i]:
-            agoodbits.append(int(abits[i]))
-            bgoodbits.append(int(bbits[i]))
-            if int(abits[i]) == int(bbits[i]):
-                match_count += 1
-
-    # After sifting and before returning the result:
-    fidelity = match_count / len(agoodbits) if agoodbits else 0
-    loss = 1 - fidelity if agoodbits else 1
-
-    # Define abort reason first
-    abort_reason = None
-    if loss > 0.15:
-        abort_reason = "Error too high! Key generation aborted."
+    diagram_url = None
+    if diagram:
+        with metrics.span("exp3", "diagram"):
+            diagram_url = save_circuit_diagram(qc2_isa, "static/circuit_exp3.png")
+
+    with metrics.span("exp3", "postprocess"):
+        # Sifting: keep only positions where Sender & Receiver used same basis
+        agoodbits, bgoodbits, _, _ = sift(abits, abase, bbase, bbits)
+
+        # Parameter estimation: QBER from a sacrificed random subset, the rest stays secret
+        estimate = estimate_qber(agoodbits, bgoodbits, test_fraction, rng)
+        agoodbits = estimate["agoodbits"]
+        bgoodbits = estimate["bgoodbits"]
+        fidelity = 1 - estimate["qber"] if estimate["test_samples"] else 0
+        loss = estimate["qber"] if estimate["test_samples"] else 1
+        debug_sampled(log, "sifted", lambda: {
+            "bit_num": bit_num, "sifted_bits": len(agoodbits) + estimate["test_samples"],
+            "test_samples": estimate["test_samples"], "test_errors": estimate["test_errors"]})
+
+        # Define abort reason first. Decided on the point estimate: a 20-qubit run
+        # only has a few test bits, so qber_ci is reported for information only.
+        abort_reason = None
+        if loss > 0.15:
+            abort_reason = "Error too high! Key generation aborted."
+
+    metrics.record_run("exp3", qber=loss, sifted_length=len(agoodbits),
+                       key_bits=0 if abort_reason else len(agoodbits), qubits=bit_num)
+    event(log, logging.WARNING if abort_reason else logging.INFO, "run_complete",
+          backend=backend.name, bit_num=bit_num, sifted_bits=len(agoodbits), qber=loss,
+          aborted=abort_reason is not None)
 
     return {
         "Sender_bits": abits.tolist(),
@@ -127,7 +141,9 @@ def run_exp3(message=None, bit_num=20, shots=1024, rng_seed=None):
         "bgoodbits": bgoodbits,  # Return the non-empty list
         "fidelity": fidelity,
         "loss": loss,
-        "circuit_diagram_url": "/static/circuit_exp3.png",
+        "qber_ci": estimate["qber_ci"],
+        "test_indices": estimate["test_indices"],
+        "circuit_diagram_url": diagram_url,
         "counts_eve": counts,
         "counts_bob": counts2,
         "abort_reason": abort_reason
@@ -1,11 +1,15 @@
+import logging
 import random
 from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
 import os
-from qiskit.visualization import circuit_drawer
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from qkd_backend.qkd_runner.parameter_estimation import estimate_qber
+from qkd_backend.qkd_runner import metrics
+from qkd_backend.qkd_runner.diagrams import save_circuit_diagram
+from qkd_backend.qkd_runner.qkd_logging import event, get_logger
+from qkd_backend.qkd_runner.sifting import sift
+from qkd_backend.qkd_runner.stabilizer import run_counts
+
+log = get_logger("exp4")
 
 def xor_encrypt_decrypt(message_bytes, key_bits):
     msg_bits = []
@@ -28,7 +32,8 @@ def xor_encrypt_decrypt(message_bytes, key_bits):
         cipher_bytes.append(byte)
     return bytes(cipher_bytes)
 
-def run_exp4(message=None, n=20):
+@metrics.instrument("exp4")
+def run_exp4(message=None, n=20, test_fraction=0.25, diagram=True):
     # Alice prepares random bits and bases
     alice_bits = [random.randint(0, 1) for _ in range(n)]
     alice_bases = [random.randint(0, 1) for _ in range(n)]  # 0 = Z-basis, 1 = X-basis
@@ -41,61 +46,60 @@ def run_exp4(message=None, n=20):
 
     # Quantum circuit
     qc = QuantumCircuit(n, n)
-    diagram_path = "static/circuit_exp4.png"
-    fig = circuit_drawer(qc, output='mpl')
-    fig.savefig(diagram_path)
-    plt.close(fig)
-
-    # Step 1: Alice encodes bits
-    for i in range(n):
-        if alice_bits[i] == 1:
-            qc.x(i)
-        if alice_bases[i] == 1:
-            qc.h(i)
-
-    # Step 2: Eve intercepts alternate bits (passive: just measures, doesn't resend)
-    for i in range(n):
-        if eve_bases[i] is not None:  
-            if eve_bases[i] == 1:
-                qc.h(i)
-            qc.measure(i, i)
-            qc.reset(i)
-            if random.randint(0, 1) == 1:
+    diagram_url = None
+    if diagram:
+        with metrics.span("exp4", "diagram"):
+            diagram_url = save_circuit_diagram(qc, "static/circuit_exp4.png")
+
+    with metrics.span("exp4", "circuit"):
+        # Step 1: Alice encodes bits
+        for i in range(n):
+            if alice_bits[i] == 1:
                 qc.x(i)
             if alice_bases[i] == 1:
                 qc.h(i)
 
-    # Step 3: Bob measures
-    for i in range(n):
-        if bob_bases[i] == 1:
-            qc.h(i)
-        qc.measure(i, i)
+        # Step 2: Eve intercepts alternate bits (passive: just measures, doesn't resend)
+        for i in range(n):
+            if eve_bases[i] is not None:  
+                if eve_bases[i] == 1:
+                    qc.h(i)
+                qc.measure(i, i)
+                qc.reset(i)
+                if random.randint(0, 1) == 1:
+                    qc.x(i)
+                if alice_bases[i] == 1:
+                    qc.h(i)
+
+        # Step 3: Bob measures
+        for i in range(n):
+            if bob_bases[i] == 1:
+                qc.h(i)
+            qc.measure(i, i)
 
     # Run the circuit once
-    sim = AerSimulator()
-    result = sim.run(qc, shots=1024).result()
-    bob_results = list(result.get_counts().keys())[0]  
-    bob_bits = [int(b) for b in bob_results[::-1]]
+    with metrics.span("exp4", "simulate"):
+        counts = run_counts(qc, shots=1024)
+        bob_results = list(counts.keys())[0]
+        bob_bits = [int(b) for b in bob_results[::-1]]
 
     # Step 4: Find matching bases and generate sifted key if QBER ≤ 11%
-    matching_indices = []
-    sifted_alice = []
-    sifted_bob = []
-
-    for i in range(n):
-        if alice_bases[i] == bob_bases[i]:
-            matching_indices.append(i)
-            sifted_alice.append(alice_bits[i])
-            sifted_bob.append(bob_bits[i])
+    with metrics.span("exp4", "postprocess"):
+        sifted_alice, sifted_bob, matching_indices, _ = sift(alice_bits, alice_bases, bob_bases, bob_bits)
 
-    # Step 5: QBER calculation
-    errors = sum(1 for a, b in zip(sifted_alice, sifted_bob) if a != b)
-    qber = (errors / len(sifted_alice)) * 100 if len(sifted_alice) > 0 else 0
+        # Step 5: QBER estimated on a sacrificed random subset; those bits leave the key
+        estimate = estimate_qber(sifted_alice, sifted_bob, test_fraction)
+        sifted_alice = estimate["agoodbits"]
+        sifted_bob = estimate["bgoodbits"]
+        qber = estimate["qber"] * 100
 
     SECURITY_THRESHOLD = 11
+    # Decided on the point estimate: a 20-qubit run only has a few test bits,
+    # so qber_ci is reported for information only
+    aborted = qber > SECURITY_THRESHOLD
 
     # Message encryption/decryption only if QBER is below threshold
-    if message is not None and sifted_alice and qber <= SECURITY_THRESHOLD:
+    if message is not None and sifted_alice and not aborted:
         message_bytes = message.encode('utf-8')
         encrypted_bytes = xor_encrypt_decrypt(message_bytes, sifted_alice)
         decrypted_bytes = xor_encrypt_decrypt(encrypted_bytes, sifted_bob)
@@ -108,12 +112,16 @@ def run_exp4(message=None, n=20):
         encrypted_hex = ""
         decrypted_message = ""
 
-    counts = result.get_counts()
+    metrics.record_run("exp4", qber=qber / 100, sifted_length=len(sifted_alice),
+                       key_bits=0 if aborted else len(sifted_alice), qubits=n)
+    event(log, logging.WARNING if aborted else logging.INFO, "run_complete",
+          n=n, sifted_bits=len(sifted_alice), qber_percent=qber, aborted=aborted)
+
     key = list(counts.keys())[0]
     emeas = list(key)
     ebits = [int(x) for x in emeas][::-1]
 
-    counts2 = result.get_counts()
+    counts2 = counts
     key2 = list(counts2.keys())[0]
     bmeas = list(key2)
     bbits = [int(x) for x in bmeas][::-1]
@@ -126,9 +134,12 @@ def run_exp4(message=None, n=20):
         "agoodbits": sifted_alice,
         "bgoodbits": sifted_bob,
         "qber": qber,
+        "qber_ci": [100 * q for q in estimate["qber_ci"]],
+        "test_indices": estimate["test_indices"],
         "fidelity": 100 - qber,
         "loss": qber,
-        "circuit_diagram_url": "/static/circuit_exp4.png",
+        "aborted": aborted,
+        "circuit_diagram_url": diagram_url,
         "counts_eve": counts,
         "counts_bob": counts2
     }
@@ -0,0 +1,234 @@
+# qkd_backend/qkd_runner/history.py
+# Persistent experiment history in SQLite.
+# record() only enqueues; a writer thread appends runs in batches (one
+# transaction per batch), and triggers make the runs table append-only.
+# Queries flush pending writes first, so a caller always sees its own runs.
+#
+#   QKD_HISTORY_DB  database path (default qkd_history.sqlite3)
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB = "qkd_history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    qber REAL,
+    sifted_length INTEGER,
+    key_bits INTEGER,
+    qubits INTEGER,
+    key_rate REAL,
+    params TEXT NOT NULL,
+    detail TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_experiment_time ON runs (experiment, created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_time ON runs (created_at);
+CREATE INDEX IF NOT EXISTS idx_runs_qber ON runs (qber);
+CREATE INDEX IF NOT EXISTS idx_runs_params ON runs (params);
+CREATE TRIGGER IF NOT EXISTS runs_no_update BEFORE UPDATE ON runs
+BEGIN SELECT RAISE(ABORT, 'runs is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS runs_no_delete BEFORE DELETE ON runs
+BEGIN SELECT RAISE(ABORT, 'runs is append-only'); END;
+"""
+
+# Result fields kept for the analysis page; bits and keys are never stored
+DETAIL_FIELDS = (
+    "fidelity", "loss", "qber_ci", "abort_reason", "circuit_diagram_url", "chsh",
+)
+# Measured bitstrings are raw key material: only how many 1s each shot had is kept
+COUNT_FIELDS = ("counts", "counts_bob")
+# Experiments that report QBER in percent rather than as a fraction
+QBER_PERCENT = {"exp4", "circuit_simulator"}
+
+COLUMNS = ("id", "experiment", "created_at", "qber", "sifted_length", "key_bits",
+           "qubits", "key_rate", "params", "detail")
+
+
+def outcome_weights(counts):
+    # Shots per number of 1s in the measured bitstring, keyed by that number
+    weights = {}
+    for bitstring, n in counts.items():
+        w = str(bitstring).count("1")
+        weights[w] = weights.get(w, 0) + int(n)
+    return {str(w): weights[w] for w in sorted(weights)}
+
+
+def summarize(experiment, result, params=None):
+    # Flatten one experiment result into a runs row (without id)
+    params = params or {}
+    if experiment in QBER_PERCENT:
+        qber = result.get("qber")
+        qber = qber / 100 if qber is not None else None
+    else:
+        qber = result.get("loss")
+    sifted = len(result["agoodbits"]) if "agoodbits" in result else None
+    if "error_corrected_key" in result:
+        key_bits = len(result["error_corrected_key"] or "")
+    elif result.get("abort_reason") or result.get("aborted"):
+        key_bits = 0
+    else:
+        key_bits = sifted
+    qubits = params.get("bit_num") or params.get("n") or len(result.get("Sender_bits") or []) or None
+    key_rate = key_bits / qubits if key_bits is not None and qubits else None
+    detail = {k: result[k] for k in DETAIL_FIELDS if k in result}
+    counts = next((result[k] for k in COUNT_FIELDS if result.get(k)), None)
+    if counts:
+        detail["outcome_weights"] = outcome_weights(counts)
+    return (experiment, time.time(), qber, sifted, key_bits, qubits, key_rate,
+            json.dumps(params, sort_keys=True, default=str), json.dumps(detail, default=str))
+
+
+def _row(row):
+    run = dict(zip(COLUMNS, row))
+    run["params"] = json.loads(run["params"])
+    run["detail"] = json.loads(run["detail"])
+    return run
+
+
+class HistoryStore:
+    def __init__(self, path=None, batch_size=100, flush_interval=0.5):
+        self.path = path or os.environ.get("QKD_HISTORY_DB", DEFAULT_DB)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = queue.Queue()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        # The write connection is shared by the writer thread and flush(), always under _write_lock
+        self._conn = self._connect(check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="qkd-history", daemon=True)
+        self._writer.start()
+
+    def _connect(self, **kwargs):
+        conn = sqlite3.connect(self.path, timeout=30, **kwargs)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # One connection per thread for queries
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- writes -------------------------------------------------------------
+
+    def record(self, experiment, result, params=None):
+        self._pending.put(summarize(experiment, result, params))
+
+    def _drain(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO runs (experiment, created_at, qber, sifted_length, key_bits, "
+                    "qubits, key_rate, params, detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            while self._drain():
+                pass
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+        self._conn.close()
+
+    # --- queries ------------------------------------------------------------
+
+    @staticmethod
+    def _filters(experiment=None, since=None, until=None, min_qber=None, max_qber=None, params=None):
+        clauses, args = [], []
+        for clause, value in (("experiment = ?", experiment), ("created_at >= ?", since),
+                              ("created_at < ?", until), ("qber >= ?", min_qber),
+                              ("qber <= ?", max_qber)):
+            if value is not None:
+                clauses.append(clause)
+                args.append(value)
+        if params is not None:
+            clauses.append("params = ?")
+            args.append(json.dumps(params, sort_keys=True, default=str))
+        return clauses, args
+
+    def query(self, limit=50, cursor=None, **filters):
+        # Newest first, keyset-paginated on (created_at, id) so every page is an index range scan.
+        # Pass next_cursor back as cursor for the following page.
+        self.flush()
+        clauses, args = self._filters(**filters)
+        if cursor:
+            created_at, _, run_id = str(cursor).partition(":")
+            clauses.append("(created_at, id) < (?, ?)")
+            args += [float(created_at), int(run_id)]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM runs {where} "
+            f"ORDER BY created_at DESC, id DESC LIMIT ?", args + [limit]).fetchall()
+        runs = [_row(r) for r in rows]
+        last = runs[-1] if len(runs) == limit else None
+        return {"runs": runs, "next_cursor": f"{last['created_at']!r}:{last['id']}" if last else None}
+
+    def latest(self, experiment=None):
+        runs = self.query(limit=1, experiment=experiment)["runs"]
+        return runs[0] if runs else None
+
+    def qber_distribution(self, bins=20, **filters):
+        # Per-experiment QBER histogram over [0, 1] plus summary statistics
+        self.flush()
+        clauses, args = self._filters(**filters)
+        clauses.append("qber IS NOT NULL")
+        where = f"WHERE {' AND '.join(clauses)}"
+        conn = self._reader()
+        hist = conn.execute(
+            f"SELECT experiment, MIN(CAST(qber * ? AS INTEGER), ? - 1) AS bin, COUNT(*) "
+            f"FROM runs {where} GROUP BY experiment, bin ORDER BY experiment, bin",
+            [bins, bins] + args).fetchall()
+        stats = conn.execute(
+            f"SELECT experiment, COUNT(*), AVG(qber), MIN(qber), MAX(qber), "
+            f"AVG(qber * qber) - AVG(qber) * AVG(qber) FROM runs {where} GROUP BY experiment",
+            args).fetchall()
+        out = {}
+        for experiment, runs, mean, lo, hi, var in stats:
+            out[experiment] = {"runs": runs, "mean": mean, "min": lo, "max": hi,
+                               "std": max(var, 0.0) ** 0.5, "counts": [0] * bins}
+        for experiment, b, count in hist:
+            out[experiment]["counts"][max(b, 0)] += count
+        return {"bins": bins, "edges": [i / bins for i in range(bins + 1)], "experiments": out}
+
+    def key_rate_trend(self, bucket_seconds=3600, **filters):
+        # Mean key rate (final key bits per qubit) and QBER per time bucket and experiment
+        self.flush()
+        clauses, args = self._filters(**filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT experiment, CAST(created_at / ? AS INTEGER) * ? AS bucket, COUNT(*), "
+            f"AVG(key_rate), AVG(qber), SUM(key_bits) FROM runs {where} "
+            f"GROUP BY experiment, bucket ORDER BY experiment, bucket",
+            [bucket_seconds, bucket_seconds] + args).fetchall()
+        out = {}
+        for experiment, bucket, runs, key_rate, qber, key_bits in rows:
+            out.setdefault(experiment, []).append({
+                "bucket_start": bucket, "runs": runs, "key_rate": key_rate,
+                "qber": qber, "key_bits": key_bits,
+            })
+        return {"bucket_seconds": bucket_seconds, "experiments": out}
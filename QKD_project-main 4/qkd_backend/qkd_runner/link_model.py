@@ -0,0 +1,225 @@
+# qkd_backend/qkd_runner/link_model.py
+# Physical BB84 link: weak-coherent (Poisson) source, fibre loss, and a
+# two-detector receiver with efficiency, dark counts, afterpulsing and dead time.
+# The E91 link places an entangled-pair source midway, with one such receiver per end.
+
+import math
+
+import numpy as np
+
+# Share of detections kept by basis sifting: BB84 keeps 1 of 2 bases, E91 2 of 9 settings.
+# "bb84" is a plain weak-coherent source, "decoy" the same link with decoy states.
+SIFT_FRACTION = {"bb84": 1 / 2, "decoy": 1 / 2, "e91": 2 / 9}
+
+
+def binary_entropy(p):
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -p * math.log2(p) - (1 - p) * math.log2(1 - p)
+
+
+def gllp_secret_fraction(gain, qber, q1, e1):
+    # GLLP bound for a weak-coherent source: only single-photon pulses carry secret
+    # key, so R / gain = [Q1 (1 - h(e1)) - Q h(E)] / Q, with Q1 the single-photon gain
+    if gain <= 0:
+        return 0.0
+    return min(1.0, max(0.0, (q1 * (1 - binary_entropy(e1)) - gain * binary_entropy(qber)) / gain))
+
+
+def worst_case_single_photon(gain, qber, mu):
+    # Without decoy states Alice and Bob must assume every multi-photon pulse was
+    # detected (photon-number splitting): Q1 >= Q - P(n >= 2), e1 <= E Q / Q1
+    q1 = gain - (1 - math.exp(-mu) * (1 + mu))
+    if q1 <= 0:
+        return 0.0, 0.5
+    return q1, min(0.5, qber * gain / q1)
+
+
+def decoy_single_photon(mu, eta, y0, misalignment):
+    # Closed-form Q1 = Y1 mu e^-mu and e1 of the link, which decoy states let Alice and Bob estimate
+    y1 = y0 + eta - y0 * eta
+    e1 = (0.5 * y0 + misalignment * eta) / y1 if y1 > 0 else 0.5
+    return y1 * mu * math.exp(-mu), e1
+
+
+def fiber_transmittance(distance_km, attenuation_db_km):
+    return 10 ** (-attenuation_db_km * distance_km / 10)
+
+
+def _dead_time_filter(click_idx, dead_time, last_click):
+    # Detectors are blind for `dead_time` pulses after each registered click.
+    # Only clicks closer than the dead time to their predecessor need the sequential pass.
+    keep = np.ones(len(click_idx), dtype=bool)
+    if dead_time <= 0 or len(click_idx) == 0:
+        return keep, (int(click_idx[-1]) if len(click_idx) else last_click)
+    gaps = np.diff(click_idx, prepend=last_click)
+    if np.all(gaps > dead_time):
+        return keep, int(click_idx[-1])
+    for k, i in enumerate(click_idx.tolist()):
+        if i > last_click + dead_time:
+            last_click = i
+        else:
+            keep[k] = False
+    return keep, last_click
+
+
+def simulate_link(n_pulses, mu=0.5, distance_km=50, attenuation_db_km=0.2,
+                  detector_eff=0.9, dark_count_prob=1e-6, afterpulse_prob=0.0,
+                  dead_time_pulses=0, misalignment=0.01, decoy=True, chunk_size=1 << 22, rng=None):
+    # Monte Carlo over individual pulses, processed in vectorized chunks.
+    # Returns detection, sifting and error counts plus the derived gain and QBER.
+    rng = np.random.default_rng(rng)
+    eta = fiber_transmittance(distance_km, attenuation_db_km) * detector_eff
+    # Thinning a Poisson source: detected photons ~ Poisson(mu * eta)
+    p_signal = 1 - math.exp(-mu * eta)
+    # Chance that a click came from a one-photon pulse, given whether a photon was detected
+    p_single_signal = mu * math.exp(-mu) * eta / p_signal if p_signal > 0 else 0.0
+    p_single_dark = mu * math.exp(-mu) * (1 - eta) / math.exp(-mu * eta)
+
+    detections = 0
+    sifted = 0
+    errors = 0
+    afterpulses = 0
+    single = 0
+    single_sifted = 0
+    single_errors = 0
+    last_click = -(1 << 62)
+
+    for offset in range(0, n_pulses, chunk_size):
+        m = min(chunk_size, n_pulses - offset)
+        signal = rng.random(m) < p_signal
+        # Dark counts are rare, so draw their positions directly for each detector
+        dark0 = np.zeros(m, dtype=bool)
+        dark1 = np.zeros(m, dtype=bool)
+        dark0[rng.integers(0, m, rng.binomial(m, dark_count_prob))] = True
+        dark1[rng.integers(0, m, rng.binomial(m, dark_count_prob))] = True
+        click_idx = np.flatnonzero(signal | dark0 | dark1)
+
+        keep, last_click = _dead_time_filter(click_idx + offset, dead_time_pulses, last_click)
+        click_idx = click_idx[keep]
+
+        # Afterpulse: a spurious click on the first pulse after the detector recovers
+        if afterpulse_prob > 0 and len(click_idx):
+            ap_idx = click_idx[rng.random(len(click_idx)) < afterpulse_prob] + dead_time_pulses + 1
+            ap_idx = ap_idx[ap_idx < m]
+            ap_idx = ap_idx[~(signal[ap_idx] | dark0[ap_idx] | dark1[ap_idx])]
+            afterpulses += len(ap_idx)
+        else:
+            ap_idx = np.empty(0, dtype=np.int64)
+
+        k = len(click_idx)
+        abits = rng.integers(0, 2, k, dtype=np.uint8)
+        has_signal = signal[click_idx]
+        # Signal photon lands in the right detector unless misaligned
+        signal_det = abits ^ (rng.random(k) < misalignment).astype(np.uint8)
+        click0 = dark0[click_idx] | (has_signal & (signal_det == 0))
+        click1 = dark1[click_idx] | (has_signal & (signal_det == 1))
+        # Double clicks are assigned a random bit
+        bbits = np.where(click0 & click1, rng.integers(0, 2, k, dtype=np.uint8), click1.astype(np.uint8))
+        match = rng.random(k) < 0.5
+        # Single-photon clicks that survived dead time; afterpulses never count as such
+        is_single = rng.random(k) < np.where(has_signal, p_single_signal, p_single_dark)
+
+        detections += k + len(ap_idx)
+        sifted += int(np.count_nonzero(match))
+        errors += int(np.count_nonzero(match & (bbits != abits)))
+        single += int(np.count_nonzero(is_single))
+        single_sifted += int(np.count_nonzero(match & is_single))
+        single_errors += int(np.count_nonzero(match & is_single & (bbits != abits)))
+        # Afterpulse bits are uncorrelated with Alice's
+        ap_match = rng.random(len(ap_idx)) < 0.5
+        sifted += int(np.count_nonzero(ap_match))
+        errors += int(np.count_nonzero(ap_match & (rng.random(len(ap_idx)) < 0.5)))
+
+    qber = errors / sifted if sifted else 0.0
+    gain = detections / n_pulses if n_pulses else 0.0
+    # Q1 and e1 as decoy states would measure them on this detector (dead time included)
+    if decoy:
+        q1 = single / n_pulses if n_pulses else 0.0
+        e1 = single_errors / single_sifted if single_sifted else 0.5
+    else:
+        q1, e1 = worst_case_single_photon(gain, qber, mu)
+    return {
+        "pulses": n_pulses,
+        "detections": detections,
+        "afterpulses": afterpulses,
+        "sifted": sifted,
+        "errors": errors,
+        "gain": gain,
+        "qber": qber,
+        "single_photon_gain": q1,
+        "single_photon_qber": e1,
+        "secret_fraction": gllp_secret_fraction(gain, qber, q1, e1),
+        "transmittance": eta,
+    }
+
+
+def expected_link(mu=0.5, distance_km=50, attenuation_db_km=0.2, detector_eff=0.9,
+                  dark_count_prob=1e-6, misalignment=0.01, decoy=True, **detector_params):
+    # Closed-form gain and QBER of the same link; dead time and afterpulsing
+    # (passed through in detector_params) are not part of the closed form
+    eta = fiber_transmittance(distance_km, attenuation_db_km) * detector_eff
+    y0 = 2 * dark_count_prob
+    signal = 1 - math.exp(-mu * eta)
+    gain = y0 + signal - y0 * signal
+    qber = (0.5 * y0 + misalignment * signal) / gain if gain > 0 else 0.0
+    if decoy:
+        q1, e1 = decoy_single_photon(mu, eta, y0, misalignment)
+    else:
+        q1, e1 = worst_case_single_photon(gain, qber, mu)
+    return {
+        "gain": gain,
+        "qber": qber,
+        "single_photon_gain": q1,
+        "single_photon_qber": e1,
+        "secret_fraction": gllp_secret_fraction(gain, qber, q1, e1),
+        "transmittance": eta,
+    }
+
+
+def expected_entangled_link(mu=0.5, distance_km=50, attenuation_db_km=0.2, detector_eff=0.9,
+                            dark_count_prob=1e-6, misalignment=0.01, **detector_params):
+    # Closed-form coincidence gain and QBER with the pair source (mu pairs per pulse,
+    # Poisson) midway, so each photon crosses distance_km / 2. Pairs split into independent
+    # Poisson streams by which ends detect them; a clean coincidence (some pair seen at both
+    # ends, nothing else clicking) errs with the misalignment, any other coincidence half the time.
+    eta = fiber_transmittance(distance_km / 2, attenuation_db_km) * detector_eff
+    y0 = 2 * dark_count_prob
+    no_click = (1 - y0) * math.exp(-mu * eta)
+    no_click_both = (1 - y0) ** 2 * math.exp(-mu * (2 * eta - eta * eta))
+    gain = 1 - 2 * no_click + no_click_both
+    clean = (1 - math.exp(-mu * eta * eta)) * (1 - y0) ** 2 * math.exp(-2 * mu * eta * (1 - eta))
+    qber = (misalignment * clean + 0.5 * (gain - clean)) / gain if gain > 0 else 0.0
+    # Neither end holds the source, so every coincidence counts and the
+    # entanglement-based rate 1 - 2 h(Q) applies
+    return {
+        "gain": gain,
+        "qber": qber,
+        "secret_fraction": max(0.0, 1 - 2 * binary_entropy(qber)),
+        "transmittance": eta,
+    }
+
+
+def keyrate_curve(distances, rep_rate=1e6, n_pulses=None, rng=None, protocol="bb84", **link_params):
+    # Secret rate R = rep_rate * gain * sift * secret_fraction at each distance: the
+    # GLLP bound for BB84 (worst-case single photons) and decoy-state BB84, 1 - 2 h(QBER)
+    # for E91. BB84 uses the Monte Carlo model when n_pulses is given, the closed form
+    # otherwise; E91 always uses its closed form.
+    if protocol not in SIFT_FRACTION:
+        raise ValueError(f"Unknown protocol '{protocol}', choose from {sorted(SIFT_FRACTION)}")
+    rng = np.random.default_rng(rng)
+    curve = []
+    for d in distances:
+        if protocol == "e91":
+            stats = expected_entangled_link(distance_km=d, **link_params)
+        elif n_pulses:
+            stats = simulate_link(n_pulses, distance_km=d, decoy=protocol == "decoy", rng=rng, **link_params)
+        else:
+            stats = expected_link(distance_km=d, decoy=protocol == "decoy", **link_params)
+        curve.append({
+            "distance_km": float(d),
+            "qber": stats["qber"],
+            "gain": stats["gain"],
+            "key_rate_bps": rep_rate * stats["gain"] * SIFT_FRACTION[protocol] * stats["secret_fraction"],
+        })
+    return curve
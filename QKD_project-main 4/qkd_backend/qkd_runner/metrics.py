@@ -0,0 +1,132 @@
+# qkd_backend/qkd_runner/metrics.py
+# Minimal in-process metrics: stage timing spans, counters and gauges,
+# rendered in Prometheus text format for the /metrics route.
+# Set QKD_METRICS=0 to disable; span() then returns a shared no-op context.
+
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("QKD_METRICS", "1") != "0"
+
+# Histogram buckets in seconds, from fast post-processing up to hardware jobs
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_lock = threading.Lock()
+_histograms = {}   # (experiment, stage) -> [bucket counts..., sum, count]
+_counters = {}     # (name, experiment) -> value
+_gauges = {}       # (name, experiment) -> value
+_NOOP = nullcontext()
+
+HELP = {
+    "qkd_stage_duration_seconds": "Time spent per experiment stage",
+    "qkd_runs_total": "Completed experiment runs",
+    "qkd_errors_total": "Experiment runs that raised",
+    "qkd_qber": "QBER of the last run (fraction)",
+    "qkd_sifted_key_length": "Sifted key length of the last run (bits)",
+    "qkd_key_rate": "Final key bits per transmitted qubit of the last run",
+}
+
+
+def observe(experiment, stage, seconds):
+    with _lock:
+        h = _histograms.get((experiment, stage))
+        if h is None:
+            h = _histograms[(experiment, stage)] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+
+@contextmanager
+def _timed(experiment, stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(experiment, stage, time.perf_counter() - t0)
+
+
+def span(experiment, stage):
+    # with span("exp2", "transpile"): ...
+    if not ENABLED:
+        return _NOOP
+    return _timed(experiment, stage)
+
+
+def inc(name, experiment, value=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[(name, experiment)] = _counters.get((name, experiment), 0) + value
+
+
+def set_gauge(name, experiment, value):
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[(name, experiment)] = float(value)
+
+
+def record_run(experiment, qber=None, sifted_length=None, key_bits=None, qubits=None):
+    # Per-run outcome gauges plus the run counter
+    if not ENABLED:
+        return
+    inc("qkd_runs_total", experiment)
+    if qber is not None:
+        set_gauge("qkd_qber", experiment, qber)
+    if sifted_length is not None:
+        set_gauge("qkd_sifted_key_length", experiment, sifted_length)
+    if key_bits is not None and qubits:
+        set_gauge("qkd_key_rate", experiment, key_bits / qubits)
+
+
+def instrument(experiment):
+    # Decorator: times the whole run as stage "total" and counts failures
+    def wrap(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                with _timed(experiment, "total"):
+                    return func(*args, **kwargs)
+            except Exception:
+                inc("qkd_errors_total", experiment)
+                raise
+        return wrapper
+    return wrap
+
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        name = "qkd_stage_duration_seconds"
+        if _histograms:
+            lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        for (experiment, stage), h in sorted(_histograms.items()):
+            labels = f'experiment="{experiment}",stage="{stage}"'
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h[-1]}')
+            lines.append(f"{name}_sum{{{labels}}} {_fmt(h[-2])}")
+            lines.append(f"{name}_count{{{labels}}} {h[-1]}")
+
+        for kind, values in (("counter", _counters), ("gauge", _gauges)):
+            for metric in sorted({n for n, _ in values}):
+                lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for (n, experiment), value in sorted(values.items()):
+                    if n == metric:
+                        lines.append(f'{metric}{{experiment="{experiment}"}} {_fmt(value)}')
+    return "\n".join(lines) + "\n"
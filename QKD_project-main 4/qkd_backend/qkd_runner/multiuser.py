@@ -1,149 +1,206 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
 import math
-import matplotlib.pyplot as plt
-import networkx as nx
+try:
+    from qkd_backend.qkd_runner.link_model import simulate_link
+except ImportError:  # `streamlit run` puts only this directory on sys.path
+    from link_model import simulate_link
 
-# --- Streamlit App ---
-st.set_page_config(page_title="Multi-user QKD BB84 Simulator", layout="wide")
-st.title("Multi-User QKD BB84 Simulator with Trusted Nodes")
-
-# --- 1. User-set (Input) Parameters ---
-st.sidebar.header("Input Parameters")
-
-total_distance = st.sidebar.number_input("Total distance (km)", min_value=1, value=500)
-link_length = st.sidebar.number_input("Link length per trusted node (km)", min_value=1, value=100)
-n_users = st.sidebar.number_input("Number of receivers (N_users)", min_value=1, value=3)
-session_key_length = st.sidebar.selectbox("K_session length (bits)", [128, 256, 512, 1024])
-distribution_mode = st.sidebar.selectbox("Distribution mode", ["Sequential", "Parallel"])
-detector_efficiency = st.sidebar.slider("Detector efficiency (%)", 0, 100, 90)
-dark_count_prob = st.sidebar.number_input("Dark count probability", 0.0, 0.01, 0.001)
-channel_attenuation = st.sidebar.number_input("Channel attenuation (dB/km)", 0.0, 1.0, 0.2)
-misalignment_error = st.sidebar.slider("Misalignment error (%)", 0, 10, 2)
-key_relay_latency = st.sidebar.number_input("Key relay latency per hop (ms)", min_value=0, value=5)
-
-# Optional: allow per-user distances
-user_distances = []
-for i in range(1, n_users + 1):
-    d = st.sidebar.number_input(f"Distance to Bob{i} (km)", min_value=1, value=int(total_distance*i/n_users))
-    user_distances.append(d)
-
-# --- 2. Derived Parameters Calculation Functions ---
+# --- Derived Parameters Calculation Functions ---
 def calculate_trusted_nodes(distance, link_length):
     return math.ceil(distance / link_length)
 
-def calculate_per_link_qber(detector_eff, dark_count, attenuation, misalignment):
-    # Simplified QBER formula
-    qber = (100 - detector_eff) * 0.01 + dark_count*100 + misalignment
-    return round(qber, 2)
+def calculate_link_stats(detector_eff, dark_count, attenuation, misalignment, link_length,
+                         mu, rep_rate_mhz, afterpulse, dead_time_ns, n_pulses, rng=None):
+    # Per-pulse Monte Carlo of one trusted-node link (see link_model.simulate_link);
+    # rng is a seed or Generator, None draws a fresh one
+    dead_time_pulses = int(round(dead_time_ns * 1e-9 * rep_rate_mhz * 1e6))
+    return simulate_link(n_pulses, mu=mu, distance_km=link_length, attenuation_db_km=attenuation,
+                         detector_eff=detector_eff / 100, dark_count_prob=dark_count,
+                         afterpulse_prob=afterpulse, dead_time_pulses=dead_time_pulses,
+                         misalignment=misalignment / 100, rng=rng)
+
+def calculate_per_link_qber(link_stats):
+    return round(link_stats["qber"] * 100, 2)
+
+def calculate_link_rate(link_stats, rep_rate_mhz):
+    # Sifted bit rate of one link in kbps (half the detections survive basis sifting)
+    return rep_rate_mhz * 1e6 * link_stats["gain"] / 2 / 1000
 
 def calculate_end_to_end_qber(per_link_qber, n_hops):
     # Approximate: Q_total = 1 - (1 - qber_per_link)^n
     q_total = 1 - ((1 - per_link_qber/100) ** n_hops)
     return round(q_total * 100, 2)
 
-def calculate_key_rate(end_to_end_qber, base_rate=50):
-    # Simplified formula: key rate decreases with QBER
-    rate = base_rate * (1 - end_to_end_qber/100)
-    return round(rate, 2)
+def calculate_key_rate(secret_fraction, base_rate=50):
+    # Secret share of the sifted rate, from the link's GLLP bound. Trusted nodes distil
+    # a key per link and relay it, so every hop runs at the per-link rate.
+    return round(base_rate * secret_fraction, 2)
 
 def calculate_time_to_form_key(session_length, key_rate, n_hops, latency):
     # Total time = session_length / key_rate + hop latencies
+    if key_rate <= 0:
+        return float("inf")
     t = session_length / key_rate + n_hops * latency / 1000.0  # convert ms to s
     return round(t, 2)
 
 # --- 3. Simulate per-user ---
-data = []
-for i, dist in enumerate(user_distances):
-    user_name = f"Bob{i+1}"
-    n_hops = calculate_trusted_nodes(dist, link_length)
-    per_link_qber = calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error)
-    end_to_end_qber = calculate_end_to_end_qber(per_link_qber, n_hops)
-    key_rate = calculate_key_rate(end_to_end_qber)
-    time_to_form = calculate_time_to_form_key(session_key_length, key_rate, n_hops, key_relay_latency)
-    success_flag = "✔" if key_rate > 0 else "✖"
-    data.append([user_name, dist, n_hops, per_link_qber, end_to_end_qber, key_rate, success_flag, time_to_form, session_key_length])
-
-# --- 4. Output Table ---
-df = pd.DataFrame(data, columns=[
+COLUMNS = [
     "Receiver", "Distance (km)", "Trusted Nodes", "Per-link QBER (%)",
-    "End-to-end QBER (%)", "End-to-end Key Rate (kbps)", "K_session formed?", 
+    "End-to-end QBER (%)", "End-to-end Key Rate (kbps)", "K_session formed?",
     "Time to Form Key (s)", "Final Key Length (bits)"
-])
-st.subheader("Per-Receiver Output Table")
-st.dataframe(df)
-
-# --- 5. Summary Statistics ---
-avg_qber = round(df["End-to-end QBER (%)"].mean(),2)
-total_key_rate = round(df["End-to-end Key Rate (kbps)"].sum(),2)
-success_count = df["K_session formed?"].value_counts().get("✔",0)
-failure_count = df["K_session formed?"].value_counts().get("✖",0)
-total_time = round(df["Time to Form Key (s)"].sum(),2)
-
-st.subheader("Summary Statistics")
-st.markdown(f"- **Average end-to-end QBER across all users:** {avg_qber}%")
-st.markdown(f"- **Total key generation rate for all users:** {total_key_rate} kbps")
-st.markdown(f"- **Number of successful sessions:** {success_count}")
-st.markdown(f"- **Number of failed sessions:** {failure_count}")
-st.markdown(f"- **Total time to form all session keys:** {total_time} s")
-
-# --- 6. Visualizations ---
-st.subheader("Visualizations")
-
-# Bar chart: Key Rate per User
-st.markdown("**Key Rate per User**")
-plt.figure(figsize=(8,4))
-plt.bar(df["Receiver"], df["End-to-end Key Rate (kbps)"], color='skyblue')
-plt.ylabel("Key Rate (kbps)")
-plt.xlabel("Receiver")
-st.pyplot(plt)
-
-# Line graph: Per-link QBER (simplified example for first user)
-st.markdown("**Per-link QBER Along the Path (Example: Bob1)**")
-plt.figure(figsize=(8,4))
-per_link_qbers = [calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error)]*calculate_trusted_nodes(user_distances[0], link_length)
-plt.plot(range(1,len(per_link_qbers)+1), per_link_qbers, marker='o', linestyle='-', color='orange')
-plt.ylabel("Per-link QBER (%)")
-plt.xlabel("Hop Number")
-plt.title("Bob1 QBER per Hop")
-st.pyplot(plt)
-
-# 6c. Network Diagram with color-coded session success/failure
-st.markdown("**Network Diagram (Alice → Trusted Nodes → Bobs)**")
-G = nx.Graph()
-G.add_node("Alice")
-node_colors = []
-
-for i, dist in enumerate(user_distances):
-    prev = "Alice"
-    n_hops = calculate_trusted_nodes(dist, link_length)
-    # add hops
-    for h in range(1, n_hops+1):
-        node_name = f"Node{i+1}_{h}"
-        G.add_node(node_name)
-        G.add_edge(prev, node_name)
-        prev = node_name
-        node_colors.append('lightgreen')  # trusted nodes always green
-    # connect final hop to Bob
-    bob_name = f"Bob{i+1}"
-    G.add_node(bob_name)
-    G.add_edge(prev, bob_name)
-    # color-code Bob by session success/failure
-    color = 'green' if df.loc[i, "K_session formed?"] == "✔" else 'red'
-    node_colors.append(color)
-
-plt.figure(figsize=(10,6))
-pos = nx.spring_layout(G, seed=42)
-# Generate node color list for all nodes: Alice + trusted nodes + Bobs
-all_nodes = list(G.nodes())
-colors_final = ['skyblue']  # Alice
-for node in all_nodes[1:]:
-    if "Bob" in node:
-        idx = int(node.replace("Bob","")) - 1
-        colors_final.append('green' if df.loc[idx,"K_session formed?"]=="✔" else 'red')
-    else:
-        colors_final.append('lightgreen')  # trusted node
-
-nx.draw(G, pos, with_labels=True, node_color=colors_final, node_size=1200, font_size=10, font_weight='bold', edge_color='gray')
-st.pyplot(plt)
\ No newline at end of file
+]
+
+def simulate_users(user_distances, link_length, link_stats, link_rate, session_key_length, key_relay_latency):
+    # One row per receiver, in COLUMNS order
+    data = []
+    for i, dist in enumerate(user_distances):
+        user_name = f"Bob{i+1}"
+        n_hops = calculate_trusted_nodes(dist, link_length)
+        per_link_qber = calculate_per_link_qber(link_stats)
+        end_to_end_qber = calculate_end_to_end_qber(per_link_qber, n_hops)
+        key_rate = calculate_key_rate(link_stats["secret_fraction"], link_rate)
+        time_to_form = calculate_time_to_form_key(session_key_length, key_rate, n_hops, key_relay_latency)
+        success_flag = "✔" if key_rate > 0 else "✖"
+        data.append([user_name, dist, n_hops, per_link_qber, end_to_end_qber, key_rate, success_flag, time_to_form, session_key_length])
+    return data
+
+def run_multiuser(user_distances=(167, 333, 500), link_length=100, session_key_length=128,
+                  detector_efficiency=90, dark_count_prob=1e-6, channel_attenuation=0.2,
+                  misalignment_error=2, key_relay_latency=5, mean_photon_number=0.5,
+                  rep_rate_mhz=100.0, afterpulse_prob=0.01, dead_time_ns=50.0, n_pulses=10**6,
+                  rng_seed=None):
+    # Headless equivalent of the Streamlit page (same defaults); one dict per receiver
+    link_stats = calculate_link_stats(
+        detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error,
+        link_length, mean_photon_number, rep_rate_mhz, afterpulse_prob, dead_time_ns, n_pulses,
+        rng=rng_seed)
+    link_rate = calculate_link_rate(link_stats, rep_rate_mhz)
+    data = simulate_users(user_distances, link_length, link_stats, link_rate, session_key_length, key_relay_latency)
+    return [dict(zip(COLUMNS, row)) for row in data]
+
+# --- Streamlit App ---
+# UI libraries are imported here so the calculations above can be used
+# headless (CLI, benchmarks) without Streamlit or matplotlib installed.
+def main():
+    import streamlit as st
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    st.set_page_config(page_title="Multi-user QKD BB84 Simulator", layout="wide")
+    st.title("Multi-User QKD BB84 Simulator with Trusted Nodes")
+
+    # --- 1. User-set (Input) Parameters ---
+    st.sidebar.header("Input Parameters")
+
+    total_distance = st.sidebar.number_input("Total distance (km)", min_value=1, value=500)
+    link_length = st.sidebar.number_input("Link length per trusted node (km)", min_value=1, value=100)
+    n_users = st.sidebar.number_input("Number of receivers (N_users)", min_value=1, value=3)
+    session_key_length = st.sidebar.selectbox("K_session length (bits)", [128, 256, 512, 1024])
+    distribution_mode = st.sidebar.selectbox("Distribution mode", ["Sequential", "Parallel"])
+    detector_efficiency = st.sidebar.slider("Detector efficiency (%)", 0, 100, 90)
+    dark_count_prob = st.sidebar.number_input("Dark count probability (per pulse, per detector)",
+                                              0.0, 0.01, 1e-6, step=1e-7, format="%.1e")
+    channel_attenuation = st.sidebar.number_input("Channel attenuation (dB/km)", 0.0, 1.0, 0.2)
+    misalignment_error = st.sidebar.slider("Misalignment error (%)", 0, 10, 2)
+    key_relay_latency = st.sidebar.number_input("Key relay latency per hop (ms)", min_value=0, value=5)
+    mean_photon_number = st.sidebar.number_input("Mean photon number μ", 0.01, 2.0, 0.5)
+    rep_rate_mhz = st.sidebar.number_input("Source repetition rate (MHz)", 0.1, 10000.0, 100.0)
+    afterpulse_prob = st.sidebar.number_input("Afterpulse probability", 0.0, 0.2, 0.01)
+    dead_time_ns = st.sidebar.number_input("Detector dead time (ns)", 0.0, 100000.0, 50.0)
+    n_pulses = st.sidebar.selectbox("Pulses simulated per link", [10**6, 10**7, 10**8])
+
+    # Optional: allow per-user distances
+    user_distances = []
+    for i in range(1, n_users + 1):
+        d = st.sidebar.number_input(f"Distance to Bob{i} (km)", min_value=1, value=int(total_distance*i/n_users))
+        user_distances.append(d)
+
+    # --- 3. Simulate per-user ---
+    link_stats = st.cache_data(calculate_link_stats)(
+        detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error,
+        link_length, mean_photon_number, rep_rate_mhz, afterpulse_prob, dead_time_ns, n_pulses)
+    link_rate = calculate_link_rate(link_stats, rep_rate_mhz)
+    data = simulate_users(user_distances, link_length, link_stats, link_rate, session_key_length, key_relay_latency)
+
+    # --- 4. Output Table ---
+    df = pd.DataFrame(data, columns=COLUMNS)
+    st.subheader("Per-Receiver Output Table")
+    st.dataframe(df)
+
+    # --- 5. Summary Statistics ---
+    avg_qber = round(df["End-to-end QBER (%)"].mean(),2)
+    total_key_rate = round(df["End-to-end Key Rate (kbps)"].sum(),2)
+    success_count = df["K_session formed?"].value_counts().get("✔",0)
+    failure_count = df["K_session formed?"].value_counts().get("✖",0)
+    total_time = round(df["Time to Form Key (s)"].sum(),2)
+
+    st.subheader("Summary Statistics")
+    st.markdown(f"- **Average end-to-end QBER across all users:** {avg_qber}%")
+    st.markdown(f"- **Total key generation rate for all users:** {total_key_rate} kbps")
+    st.markdown(f"- **Number of successful sessions:** {success_count}")
+    st.markdown(f"- **Number of failed sessions:** {failure_count}")
+    st.markdown(f"- **Total time to form all session keys:** {total_time} s")
+
+    # --- 6. Visualizations ---
+    st.subheader("Visualizations")
+
+    # Bar chart: Key Rate per User
+    st.markdown("**Key Rate per User**")
+    plt.figure(figsize=(8,4))
+    plt.bar(df["Receiver"], df["End-to-end Key Rate (kbps)"], color='skyblue')
+    plt.ylabel("Key Rate (kbps)")
+    plt.xlabel("Receiver")
+    st.pyplot(plt)
+
+    # Line graph: Per-link QBER (simplified example for first user)
+    st.markdown("**Per-link QBER Along the Path (Example: Bob1)**")
+    plt.figure(figsize=(8,4))
+    per_link_qbers = [calculate_per_link_qber(link_stats)]*calculate_trusted_nodes(user_distances[0], link_length)
+    plt.plot(range(1,len(per_link_qbers)+1), per_link_qbers, marker='o', linestyle='-', color='orange')
+    plt.ylabel("Per-link QBER (%)")
+    plt.xlabel("Hop Number")
+    plt.title("Bob1 QBER per Hop")
+    st.pyplot(plt)
+
+    # 6c. Network Diagram with color-coded session success/failure
+    st.markdown("**Network Diagram (Alice → Trusted Nodes → Bobs)**")
+    G = nx.Graph()
+    G.add_node("Alice")
+    node_colors = []
+
+    for i, dist in enumerate(user_distances):
+        prev = "Alice"
+        n_hops = calculate_trusted_nodes(dist, link_length)
+        # add hops
+        for h in range(1, n_hops+1):
+            node_name = f"Node{i+1}_{h}"
+            G.add_node(node_name)
+            G.add_edge(prev, node_name)
+            prev = node_name
+            node_colors.append('lightgreen')  # trusted nodes always green
+        # connect final hop to Bob
+        bob_name = f"Bob{i+1}"
+        G.add_node(bob_name)
+        G.add_edge(prev, bob_name)
+        # color-code Bob by session success/failure
+        color = 'green' if df.loc[i, "K_session formed?"] == "✔" else 'red'
+        node_colors.append(color)
+
+    plt.figure(figsize=(10,6))
+    pos = nx.spring_layout(G, seed=42)
+    # Generate node color list for all nodes: Alice + trusted nodes + Bobs
+    all_nodes = list(G.nodes())
+    colors_final = ['skyblue']  # Alice
+    for node in all_nodes[1:]:
+        if "Bob" in node:
+            idx = int(node.replace("Bob","")) - 1
+            colors_final.append('green' if df.loc[idx,"K_session formed?"]=="✔" else 'red')
+        else:
+            colors_final.append('lightgreen')  # trusted node
+
+    nx.draw(G, pos, with_labels=True, node_color=colors_final, node_size=1200, font_size=10, font_weight='bold', edge_color='gray')
+    st.pyplot(plt)
+
+
+if __name__ == "__main__":
+    main()
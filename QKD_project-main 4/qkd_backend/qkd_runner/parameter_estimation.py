@@ -0,0 +1,94 @@
+# qkd_backend/qkd_runner/parameter_estimation.py
+# Parameter estimation: sacrifice a random subset of the sifted key to estimate QBER.
+
+import math
+from collections import deque
+from statistics import NormalDist
+
+import numpy as np
+
+
+def sample_test_indices(n, test_fraction=0.25, rng=None, min_samples=1):
+    # Random, non-repeating test positions drawn in one vectorized call
+    rng = np.random.default_rng(rng)
+    if n <= 0 or test_fraction <= 0:
+        return np.empty(0, dtype=np.int64)
+    k = max(min_samples, int(math.ceil(n * test_fraction)))
+    k = min(k, n)
+    return np.sort(rng.choice(n, size=k, replace=False))
+
+
+def wilson_interval(errors, samples, confidence=0.95):
+    # Wilson score interval for a binomial proportion (stays within [0, 1] for small samples)
+    if samples <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = errors / samples
+    denom = 1 + z * z / samples
+    centre = (p + z * z / (2 * samples)) / denom
+    half = z * math.sqrt(p * (1 - p) / samples + z * z / (4 * samples * samples)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def estimate_qber(agoodbits, bgoodbits, test_fraction=0.25, rng=None, confidence=0.95):
+    # Compare Alice's and Bob's bits on a random test subset only, then drop those bits from the key
+    a = np.asarray(agoodbits, dtype=np.uint8)
+    b = np.asarray(bgoodbits, dtype=np.uint8)
+    n = len(a)
+    test_idx = sample_test_indices(n, test_fraction, rng)
+
+    keep = np.ones(n, dtype=bool)
+    keep[test_idx] = False
+
+    samples = len(test_idx)
+    errors = int(np.count_nonzero(a[test_idx] != b[test_idx]))
+    qber = errors / samples if samples else 0.0
+    ci_low, ci_high = wilson_interval(errors, samples, confidence)
+
+    return {
+        "qber": qber,
+        "qber_ci": [ci_low, ci_high],
+        "confidence": confidence,
+        "test_errors": errors,
+        "test_samples": samples,
+        "test_indices": test_idx.tolist(),
+        "agoodbits": a[keep].tolist(),
+        "bgoodbits": b[keep].tolist(),
+    }
+
+
+class QberWindow:
+    # Streaming estimation over successive blocks. update() returns the block's own
+    # estimate together with one over the last `window` blocks, which follows channel
+    # drift and sets the reconciliation block size. Security decisions should use the
+    # block's own qber_ci, which bounds its errors.
+    def __init__(self, test_fraction=0.25, rng=None, confidence=0.95, window=8):
+        self.test_fraction = test_fraction
+        self.confidence = confidence
+        self._rng = np.random.default_rng(rng)
+        self._recent = deque(maxlen=window)
+
+    def update(self, agoodbits, bgoodbits):
+        est = estimate_qber(agoodbits, bgoodbits, self.test_fraction, self._rng, self.confidence)
+        self._recent.append((est["test_errors"], est["test_samples"]))
+        errors = sum(e for e, _ in self._recent)
+        samples = sum(s for _, s in self._recent)
+        est["window_qber"] = errors / samples if samples else 0.0
+        est["window_qber_ci"] = list(wilson_interval(errors, samples, self.confidence))
+        est["block_size"] = reconciliation_block_size(est["window_qber_ci"][1])
+        return est
+
+
+def stream_qber(blocks, test_fraction=0.25, rng=None, confidence=0.95, window=8):
+    # QberWindow over an iterable of (agoodbits, bgoodbits) blocks
+    estimator = QberWindow(test_fraction, rng, confidence, window)
+    for agoodbits, bgoodbits in blocks:
+        yield estimator.update(agoodbits, bgoodbits)
+
+
+def reconciliation_block_size(qber, max_block=64):
+    # Cascade first-pass block size (~0.73 / QBER), used to adapt
+    # reconciliation to the currently estimated error rate
+    if qber <= 0:
+        return max_block
+    return int(min(max_block, max(2, round(0.73 / qber))))
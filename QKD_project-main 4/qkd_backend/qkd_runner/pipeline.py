@@ -0,0 +1,320 @@
+# qkd_backend/qkd_runner/pipeline.py
+# Continuous BB84 key generation: raw detection -> sifting -> estimation ->
+# reconciliation -> amplification, each stage in its own worker thread and
+# joined by bounded queues so a slow stage applies backpressure upstream.
+
+import hashlib
+import queue
+import threading
+import time
+
+import numpy as np
+
+from qkd_backend.qkd_runner.link_model import binary_entropy
+from qkd_backend.qkd_runner.parameter_estimation import QberWindow
+from qkd_backend.qkd_runner.sifting import sift
+
+# Blocks whose QBER upper bound exceeds this leave no secret key (BB84, one-way post-processing)
+QBER_ABORT = 0.11
+# Bits of the hash compared after reconciliation; they are disclosed, so count as leaked
+VERIFY_TAG_BITS = 64
+
+
+def cascade_correct(agoodbits, bgoodbits, block_size=16, passes=4, rng=None):
+    # Cascade reconciliation. Each pass shuffles the key with a public permutation
+    # (none on the first), compares block parities and binary-searches every
+    # odd-parity block down to one error, which Bob flips. The flip makes the block
+    # holding that bit odd in every earlier pass, so those are searched again.
+    # Returns Bob's corrected bits and the number of parities disclosed.
+    rng = np.random.default_rng(rng)
+    a = np.asarray(agoodbits, dtype=np.uint8)
+    b = np.array(bgoodbits, dtype=np.uint8)
+    n = len(a)
+    leaked = 0
+    if n == 0:
+        return b, leaked
+    perms, positions, sizes = [], [], []
+
+    def odd(p, blk):
+        seg = perms[p][blk * sizes[p]:(blk + 1) * sizes[p]]
+        return bool(np.count_nonzero(a[seg] ^ b[seg]) % 2)
+
+    def bisect(p, blk):
+        nonlocal leaked
+        idx = perms[p]
+        lo, hi = blk * sizes[p], min((blk + 1) * sizes[p], n)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            leaked += 1
+            if np.count_nonzero(a[idx[lo:mid]] ^ b[idx[lo:mid]]) % 2:
+                hi = mid
+            else:
+                lo = mid
+        return idx[lo]
+
+    for p in range(passes):
+        perm = np.arange(n) if p == 0 else rng.permutation(n)
+        size = min(block_size << p, n)
+        where = np.empty(n, dtype=np.int64)
+        where[perm] = np.arange(n)
+        perms.append(perm)
+        positions.append(where)
+        sizes.append(size)
+
+        starts = np.arange(0, n, size)
+        leaked += len(starts)
+        pending = [(p, int(blk)) for blk in np.flatnonzero(np.add.reduceat(a[perm] ^ b[perm], starts) % 2)]
+        while pending:
+            q, blk = pending.pop()
+            if not odd(q, blk):
+                continue
+            i = bisect(q, blk)
+            b[i] ^= 1
+            pending.extend((r, int(positions[r][i] // sizes[r])) for r in range(p + 1) if r != q)
+    return b, leaked
+
+
+def key_digest(key_bits, tag_bits=VERIFY_TAG_BITS):
+    # Short public hash of a key, compared by both sides to confirm reconciliation
+    packed = np.packbits(np.asarray(key_bits, dtype=np.uint8)).tobytes()
+    return hashlib.sha256(packed).digest()[:tag_bits // 8]
+
+
+def privacy_amplify(key_bits, qber_upper, leaked_bits):
+    # Compress the reconciled key to the length Eve cannot know, using SHAKE-256 as the extractor
+    n = len(key_bits)
+    secret_len = int(n * (1 - binary_entropy(qber_upper)) - leaked_bits)
+    if secret_len < 8:
+        return b""
+    packed = np.packbits(np.asarray(key_bits, dtype=np.uint8)).tobytes()
+    return hashlib.shake_256(packed).digest(secret_len // 8)
+
+
+class KeyBuffer:
+    # Thread-safe store of finished secret key bytes
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self._data = bytearray()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def append(self, key_bytes, timeout=None):
+        # Add key once there is room for it, or return False if none freed up in time.
+        # Key is never discarded; a full buffer holds the producer back instead.
+        with self._available:
+            ok = self._available.wait_for(
+                lambda: not self._data or len(self._data) + len(key_bytes) <= self.capacity, timeout)
+            if not ok:
+                return False
+            self._data.extend(key_bytes)
+            self._available.notify_all()
+            return True
+
+    def take(self, n_bytes, timeout=None):
+        # Remove and return n_bytes of key, or None if not enough arrived in time
+        with self._available:
+            ok = self._available.wait_for(lambda: len(self._data) >= n_bytes, timeout)
+            if not ok:
+                return None
+            out = bytes(self._data[:n_bytes])
+            del self._data[:n_bytes]
+            self._available.notify_all()
+            return out
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.bits_in = 0
+        self.bits_out = 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, bits_in, bits_out, seconds):
+        with self._lock:
+            self.items += 1
+            self.bits_in += bits_in
+            self.bits_out += bits_out
+            self.busy_seconds += seconds
+
+    def snapshot(self, queue_depth, queue_size):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "stage": self.name,
+                "blocks": self.items,
+                "bits_in": self.bits_in,
+                "bits_out": self.bits_out,
+                "busy_seconds": round(self.busy_seconds, 6),
+                "throughput_bps": self.bits_out / elapsed if elapsed > 0 else 0.0,
+                "utilization": self.busy_seconds / elapsed if elapsed > 0 else 0.0,
+                "queue_depth": queue_depth,
+                "queue_size": queue_size,
+            }
+
+
+class KeyPipeline:
+    STAGES = ("detection", "sifting", "estimation", "reconciliation", "amplification")
+
+    def __init__(self, block_size=4096, error_rate=0.02, test_fraction=0.1,
+                 queue_size=8, rng_seed=None, key_buffer=None, confidence=0.95, qber_window=8):
+        self.block_size = block_size
+        self.error_rate = error_rate
+        self.test_fraction = test_fraction
+        self.confidence = confidence
+        self.qber_window = qber_window
+        self.queue_size = queue_size
+        self.key_buffer = key_buffer if key_buffer is not None else KeyBuffer()
+        self._rng_seed = rng_seed
+        self._stop = threading.Event()
+        self._threads = []
+        # queues[i] feeds stage i; detection is the source and has no input queue
+        self._queues = [None] + [queue.Queue(maxsize=queue_size) for _ in self.STAGES[1:]]
+        self._metrics = {name: StageMetrics(name) for name in self.STAGES}
+        self._estimator = None
+        self._window_qber = None
+        self._dropped = {"qber": 0, "verification": 0}
+        self._dropped_lock = threading.Lock()
+
+    # --- stages -------------------------------------------------------------
+
+    def _detect(self, rng):
+        # Raw detections for one block of prepare-and-measure rounds
+        n = self.block_size
+        abits = rng.integers(0, 2, n, dtype=np.uint8)
+        abase = rng.integers(0, 2, n, dtype=np.uint8)
+        bbase = rng.integers(0, 2, n, dtype=np.uint8)
+        match = abase == bbase
+        # Wrong basis gives a coin flip, matching basis flips with the channel error rate
+        flip = np.where(match, rng.random(n) < self.error_rate, rng.random(n) < 0.5)
+        bbits = abits ^ flip.astype(np.uint8)
+        return {"abits": abits, "abase": abase, "bbase": bbase, "bbits": bbits}, n, n
+
+    def _sift(self, block, rng):
+        agoodbits, bgoodbits, _, _ = sift(block["abits"], block["abase"], block["bbase"], block["bbits"])
+        out = {"agoodbits": agoodbits, "bgoodbits": bgoodbits}
+        return out, len(block["abits"]), len(agoodbits)
+
+    def _drop(self, reason):
+        with self._dropped_lock:
+            self._dropped[reason] += 1
+
+    def _estimate(self, block, rng):
+        # Created on the estimation thread so it samples test bits with that stage's rng
+        if self._estimator is None:
+            self._estimator = QberWindow(self.test_fraction, rng, self.confidence, self.qber_window)
+        est = self._estimator.update(block["agoodbits"], block["bgoodbits"])
+        self._window_qber = est["window_qber"]
+        # The block's own bound covers its errors; a block above the threshold has no secret key
+        upper = est["qber_ci"][1]
+        if upper > QBER_ABORT:
+            self._drop("qber")
+            return None, len(block["agoodbits"]), 0
+        out = {
+            "agoodbits": est["agoodbits"],
+            "bgoodbits": est["bgoodbits"],
+            "qber_upper": upper,
+            "cascade_block": est["block_size"],
+        }
+        return out, len(block["agoodbits"]), len(out["agoodbits"])
+
+    def _reconcile(self, block, rng):
+        corrected, leaked = cascade_correct(block["agoodbits"], block["bgoodbits"],
+                                            block["cascade_block"], rng=rng)
+        # Residual errors are caught by comparing hashes; such blocks are dropped
+        if key_digest(block["agoodbits"]) != key_digest(corrected):
+            self._drop("verification")
+            return None, len(corrected), 0
+        out = {"agoodbits": block["agoodbits"], "key_bits": corrected,
+               "leaked": leaked + VERIFY_TAG_BITS, "qber_upper": block["qber_upper"]}
+        return out, len(corrected), len(corrected)
+
+    def _amplify(self, block, rng):
+        key = privacy_amplify(block["key_bits"], block["qber_upper"], block["leaked"])
+        alice_key = privacy_amplify(block["agoodbits"], block["qber_upper"], block["leaked"])
+        if key != alice_key:
+            self._drop("verification")
+            return None, len(block["key_bits"]), 0
+        # Wait for room in the buffer rather than discarding key
+        while key and not self.key_buffer.append(key, timeout=0.1):
+            if self._stop.is_set():
+                break
+        return None, len(block["key_bits"]), 8 * len(key)
+
+    # --- workers ------------------------------------------------------------
+
+    def _put(self, q, item):
+        # Blocking put that still notices shutdown; this is where backpressure happens
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, index, func, seed):
+        rng = np.random.default_rng(seed)
+        name = self.STAGES[index]
+        in_q = self._queues[index]
+        out_q = self._queues[index + 1] if index + 1 < len(self.STAGES) else None
+        metrics = self._metrics[name]
+        while not self._stop.is_set():
+            if in_q is None:
+                item = None
+            else:
+                try:
+                    item = in_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            t0 = time.perf_counter()
+            out, bits_in, bits_out = func(item, rng) if in_q is not None else func(rng)
+            metrics.record(bits_in, bits_out, time.perf_counter() - t0)
+            # A stage returns None for a block it dropped
+            if out_q is not None and out is not None and not self._put(out_q, out):
+                break
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stop.clear()
+        funcs = (self._detect, self._sift, self._estimate, self._reconcile, self._amplify)
+        seeds = np.random.SeedSequence(self._rng_seed).spawn(len(funcs))
+        for i, func in enumerate(funcs):
+            t = threading.Thread(target=self._worker, args=(i, func, seeds[i]),
+                                 name=f"qkd-{self.STAGES[i]}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def stats(self):
+        stages = []
+        for i, name in enumerate(self.STAGES):
+            q = self._queues[i]
+            depth = q.qsize() if q is not None else 0
+            stages.append(self._metrics[name].snapshot(depth, self.queue_size if q else 0))
+        with self._dropped_lock:
+            dropped = dict(self._dropped)
+        return {
+            "running": self.running,
+            "qber_estimate": self._window_qber,
+            "dropped_blocks": dropped,
+            "key_buffer_bytes": len(self.key_buffer),
+            "stages": stages,
+        }
@@ -0,0 +1,129 @@
+# qkd_backend/qkd_runner/qkd_logging.py
+# Structured, level-controlled logging for the experiments.
+# Records go through a QueueHandler so the experiment thread only enqueues;
+# a QueueListener thread formats them as one JSON object per line on stderr.
+#
+#   QKD_LOG_LEVEL         WARNING (default), INFO, DEBUG, ...
+#   QKD_LOG_DEBUG_SAMPLE  fraction of debug events actually emitted (default 0.01)
+#
+# Key material (raw/sifted bits, corrected or secret keys) is never logged:
+# pass lengths and rates instead. Field names in SENSITIVE_FIELDS are dropped
+# by a filter in case one slips through.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+ROOT_LOGGER = "qkd"
+SENSITIVE_FIELDS = frozenset({
+    "abits", "bbits", "agoodbits", "bgoodbits", "key", "secret_key",
+    "error_corrected_key", "corrected_bbits", "key_hex",
+})
+
+_configured = False
+_config_lock = threading.Lock()
+_listener = None
+_debug_sample = 0.01
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RedactFilter(logging.Filter):
+    def filter(self, record):
+        fields = getattr(record, "fields", None)
+        if fields and not SENSITIVE_FIELDS.isdisjoint(fields):
+            record.fields = {k: v for k, v in fields.items() if k not in SENSITIVE_FIELDS}
+        return True
+
+
+def configure(level=None, debug_sample=None, stream=None):
+    # Idempotent; called lazily by get_logger() with the environment defaults
+    global _configured, _listener, _debug_sample
+    with _config_lock:
+        if _configured and level is None and debug_sample is None and stream is None:
+            return
+        level = level or os.environ.get("QKD_LOG_LEVEL", "WARNING")
+        if debug_sample is None:
+            debug_sample = float(os.environ.get("QKD_LOG_DEBUG_SAMPLE", "0.01"))
+        _debug_sample = debug_sample
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.propagate = False
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for h in list(root.handlers):
+            root.removeHandler(h)
+
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter())
+        output.addFilter(RedactFilter())
+        q = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(q))
+        _listener = logging.handlers.QueueListener(q, output, respect_handler_level=True)
+        _listener.start()
+        if not _configured:
+            atexit.register(shutdown)
+        _configured = True
+
+
+def shutdown():
+    # Flush queued records; registered with atexit
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (e.g. gunicorn workers); start a new one on the same queue
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(
+            _listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_logger(name):
+    configure()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def event(logger, level, name, **fields):
+    # Log an event with structured fields; no formatting or I/O unless the level is on
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={"fields": fields})
+
+
+def debug_sampled(logger, name, fields_fn=None):
+    # Debug output for hot paths: emitted for a random QKD_LOG_DEBUG_SAMPLE share
+    # of calls. fields_fn is only called for emitted events, so callers can pass
+    # a lambda and skip building the fields entirely otherwise.
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= _debug_sample:
+        return
+    fields = fields_fn() if fields_fn is not None else {}
+    logger.debug(name, extra={"fields": fields})
+
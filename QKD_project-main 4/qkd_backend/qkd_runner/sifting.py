@@ -0,0 +1,27 @@
+# qkd_backend/qkd_runner/sifting.py
+# BB84 sifting shared by all experiments: boolean-mask selection instead of per-bit Python loops.
+
+import numpy as np
+
+
+def _as_bits(x):
+    # Accepts lists, float arrays from np.round(...) or integer arrays
+    return np.asarray(x).astype(np.uint8, copy=False)
+
+
+def sift(abits, abase, bbase, bbits):
+    # Keep positions where Sender and Receiver used the same basis.
+    # Returns (agoodbits, bgoodbits, matched_indices, error_count).
+    abits = _as_bits(abits)
+    bbits = _as_bits(bbits)
+    mask = _as_bits(abase) == _as_bits(bbase)
+    agoodbits = abits[mask]
+    bgoodbits = bbits[mask]
+    errors = int(np.count_nonzero(agoodbits != bgoodbits))
+    return agoodbits, bgoodbits, np.flatnonzero(mask), errors
+
+
+def bitstring_to_bits(bitstring, bit_num=None):
+    # Qiskit count keys are big-endian ("c[n-1]...c[0]"); return bits in qubit order
+    bits = np.frombuffer(bitstring.encode("ascii"), dtype=np.uint8)[::-1] - ord("0")
+    return bits if bit_num is None else bits[:bit_num]
@@ -0,0 +1,98 @@
+# qkd_backend/qkd_runner/stabilizer.py
+# Simulator selection for the ideal (noise-free) experiments.
+# BB84 circuits only use X, H, measure and reset on independent qubits, so each
+# qubit stays a single-qubit stabilizer state: one Pauli axis and a sign. That
+# state is tracked for all shots at once in numpy, which costs O(qubits x shots)
+# time and memory and handles thousands of qubits in one register.
+# Clifford circuits with entangling gates go to Aer's stabilizer method, and
+# everything else to the default Aer simulator.
+
+import numpy as np
+
+from qkd_backend.qkd_runner.backends import get_simulator
+
+# Stabilizer axis of each qubit per shot
+Z, X, Y = 0, 1, 2
+
+SINGLE_QUBIT_CLIFFORD = frozenset({"id", "x", "y", "z", "h", "s", "sdg", "sx", "sxdg"})
+MULTI_QUBIT_CLIFFORD = frozenset({"cx", "cy", "cz", "swap", "ecr"})
+NON_UNITARY = frozenset({"measure", "reset", "barrier", "delay"})
+
+
+def is_clifford(qc):
+    allowed = SINGLE_QUBIT_CLIFFORD | MULTI_QUBIT_CLIFFORD | NON_UNITARY
+    return all(inst.operation.name in allowed for inst in qc.data)
+
+
+def is_product_clifford(qc):
+    # No entangling gates, and a single classical register so counts keys have no spaces
+    allowed = SINGLE_QUBIT_CLIFFORD | NON_UNITARY
+    return (len(qc.cregs) == 1 and qc.num_clbits == qc.cregs[0].size
+            and all(inst.operation.name in allowed for inst in qc.data))
+
+
+def _apply(name, axis, sign):
+    # Conjugate the stabilizer (axis, sign) of one qubit by a single-qubit Clifford, in place
+    on_x, on_y, on_z = axis == X, axis == Y, axis == Z
+    if name == "x":
+        sign ^= ~on_x
+    elif name == "y":
+        sign ^= ~on_y
+    elif name == "z":
+        sign ^= ~on_z
+    elif name == "h":
+        # Z <-> X, Y -> -Y
+        axis[on_z], axis[on_x] = X, Z
+        sign ^= on_y
+    elif name in ("s", "sxdg"):
+        # s: X -> Y, Y -> -X; sxdg: Z -> Y, Y -> -Z
+        src = X if name == "s" else Z
+        on_src = on_x if name == "s" else on_z
+        axis[on_src], axis[on_y] = Y, src
+        sign ^= on_y
+    elif name in ("sdg", "sx"):
+        # sdg: X -> -Y, Y -> X; sx: Z -> -Y, Y -> Z
+        src = X if name == "sdg" else Z
+        on_src = on_x if name == "sdg" else on_z
+        axis[on_src], axis[on_y] = Y, src
+        sign ^= on_src
+
+
+def sample_product_clifford(qc, shots=1024, seed=None):
+    # Counts for a circuit accepted by is_product_clifford(), in Qiskit's format
+    # (clbit 0 rightmost). Keys are ordered by first occurrence, like a shot log.
+    rng = np.random.default_rng(seed)
+    axis = np.zeros((qc.num_qubits, shots), dtype=np.uint8)
+    sign = np.zeros((qc.num_qubits, shots), dtype=bool)
+    clbits = np.zeros((qc.num_clbits, shots), dtype=bool)
+    for inst in qc.data:
+        name = inst.operation.name
+        if name in ("id", "barrier", "delay"):
+            continue
+        q = qc.find_bit(inst.qubits[0]).index
+        if name == "measure":
+            # Z eigenstates give their sign; X/Y eigenstates a fair coin, then collapse onto Z
+            undetermined = axis[q] != Z
+            sign[q, undetermined] = rng.random(int(undetermined.sum())) < 0.5
+            axis[q] = Z
+            clbits[qc.find_bit(inst.clbits[0]).index] = sign[q]
+        elif name == "reset":
+            axis[q] = Z
+            sign[q] = False
+        else:
+            _apply(name, axis[q], sign[q])
+
+    if qc.num_clbits == 0:
+        return {"": shots}
+    rows = clbits[::-1].T.view(np.uint8) + ord("0")
+    outcomes, first, counts = np.unique(rows, axis=0, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    return {outcomes[i].tobytes().decode("ascii"): int(counts[i]) for i in order}
+
+
+def run_counts(qc, shots=1024, seed=None):
+    # Ideal measurement counts, using the cheapest exact method for the circuit
+    if is_product_clifford(qc):
+        return sample_product_clifford(qc, shots, seed)
+    sim = get_simulator(method="stabilizer" if is_clifford(qc) else "automatic")
+    return sim.run(qc, shots=shots, seed_simulator=seed).result().get_counts()
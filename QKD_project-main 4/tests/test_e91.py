@@ -0,0 +1,29 @@
+# tests/test_e91.py
+# The numpy and Aer samplers draw from the same pair statistics.
+
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner import e91
+
+
+@pytest.mark.parametrize("noise", [0.0, 0.1])
+def test_fast_and_aer_agree(noise):
+    runs = {m: e91.run_e91(n_pairs=20_000, noise=noise, method=m, rng_seed=3, diagram=False)
+            for m in ("fast", "aer")}
+    expected_s = 2 * np.sqrt(2) * (1 - noise)
+    for r in runs.values():
+        assert r["chsh"]["S"] == pytest.approx(expected_s, abs=0.1)
+        assert r["loss"] == pytest.approx(noise / 2, abs=0.02)
+    assert runs["fast"]["chsh"]["S"] == pytest.approx(runs["aer"]["chsh"]["S"], abs=0.15)
+
+
+def test_eve_breaks_chsh():
+    r = e91.run_e91(n_pairs=20_000, eve=True, method="fast", rng_seed=3, diagram=False)
+    assert not r["chsh"]["violated"]
+    assert r["abort_reason"]
+
+
+def test_aer_pair_cap():
+    with pytest.raises(ValueError):
+        e91.run_e91(n_pairs=e91.AER_MAX_PAIRS + 1, method="aer", diagram=False)
@@ -0,0 +1,36 @@
+# tests/test_encoding.py
+# Every negotiated response format decodes back to the plain result.
+
+import pytest
+
+from qkd_backend.qkd_runner import encoding
+
+RESULT = {
+    "Sender_bits": [0, 1, 1, 0, 1, 0, 0, 1, 1],
+    "Sender_bases": [0, 2, 1, 1, 0, 2, 2, 1, 0],  # E91 settings, not bits
+    "agoodbits": [],
+    "counts": {"0110": 3, "1111": 1},
+    "counts_eve": {"01 10": 2},
+    "steps": [{"step": 1, "qber": 0.1}, {"step": 2, "qber": 0.2}],
+    "distances": [0, 1, 1],
+    "loss": 0.05,
+    "abort_reason": None,
+}
+
+
+@pytest.mark.parametrize("mimetype", encoding.supported_mimetypes())
+@pytest.mark.parametrize("accept_gzip", [False, True])
+def test_round_trip(mimetype, accept_gzip):
+    result = dict(RESULT, Receiver_bits=[1, 0] * 1000)
+    body, content_type, headers = encoding.encode_response(result, mimetype, accept_gzip)
+    assert content_type == mimetype
+    assert encoding.decode_response(body, content_type) == result
+
+
+def test_compact_packs_only_known_fields():
+    out = encoding.compact(RESULT)
+    assert "$bits" in out["Sender_bits"]
+    assert out["Sender_bases"] == RESULT["Sender_bases"]
+    assert out["distances"] == RESULT["distances"]
+    assert "$counts" in out["counts"]
+    assert out["counts_eve"] == RESULT["counts_eve"]
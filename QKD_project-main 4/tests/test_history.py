@@ -0,0 +1,66 @@
+# tests/test_history.py
+# Run summaries: key bits follow what the runner decided, raw measurement data is
+# never stored, and history pages walk every run exactly once.
+
+import json
+
+import pytest
+
+from qkd_backend.qkd_runner.history import HistoryStore, summarize
+
+
+def run(experiment, result, params=None):
+    row = summarize(experiment, result, params)
+    return dict(zip(("experiment", "created_at", "qber", "sifted_length", "key_bits",
+                     "qubits", "key_rate", "params", "detail"), row))
+
+
+@pytest.mark.parametrize("aborted, key_bits", [(True, 0), (False, 6)])
+def test_exp4_key_bits_follow_aborted_flag(aborted, key_bits):
+    # QBER in percent; 20% would have been an abort under the old re-derived check
+    row = run("exp4", {"qber": 20 if not aborted else 2, "aborted": aborted,
+                       "agoodbits": [0, 1] * 3})
+    assert row["key_bits"] == key_bits
+    assert row["qber"] == pytest.approx(0.2 if not aborted else 0.02)
+
+
+def test_key_bits_from_error_corrected_key():
+    row = run("e91", {"loss": 0.03, "Sender_bits": [0] * 40, "agoodbits": [1] * 10,
+                      "error_corrected_key": "0110"})
+    assert (row["sifted_length"], row["key_bits"], row["qubits"]) == (10, 4, 40)
+    assert row["key_rate"] == pytest.approx(0.1)
+
+
+def test_abort_reason_means_no_key():
+    row = run("exp2", {"loss": 0.3, "agoodbits": [1] * 10, "abort_reason": "Error too high!"})
+    assert row["key_bits"] == 0
+
+
+def test_measured_bitstrings_are_not_stored():
+    result = {"loss": 0.0, "counts_bob": {"0110": 3, "1111": 1}, "counts_eve": {"0101": 4},
+              "Sender_bits": [0, 1, 1, 0], "agoodbits": [0, 1], "fidelity": 1.0}
+    detail = json.loads(run("exp3", result)["detail"])
+    assert detail == {"fidelity": 1.0, "loss": 0.0, "outcome_weights": {"2": 3, "4": 1}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=60)
+    yield store
+    store.close()
+
+
+def test_pagination_visits_every_run_once(store):
+    for i in range(25):
+        store.record("exp1" if i % 2 else "exp2", {"loss": i / 100, "agoodbits": [1] * i})
+    seen, cursor = [], None
+    while True:
+        page = store.query(limit=10, cursor=cursor)
+        seen += [r["id"] for r in page["runs"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == list(range(1, 26))
+    assert len(set(seen)) == 25
+    assert all(r["experiment"] == "exp1" for r in store.query(limit=50, experiment="exp1")["runs"])
+    assert store.latest("exp2")["sifted_length"] == 24
@@ -0,0 +1,45 @@
+# tests/test_link_model.py
+# Secret fraction and key rate of the weak-coherent link model: the GLLP bound
+# stays a fraction, and detector dead time can only cost key.
+
+import pytest
+
+from qkd_backend.qkd_runner.link_model import expected_link, keyrate_curve, simulate_link
+
+DISTANCES = [0, 10, 50]
+
+
+@pytest.mark.parametrize("decoy", [True, False])
+@pytest.mark.parametrize("dead_time", [0, 5, 50])
+@pytest.mark.parametrize("distance", DISTANCES)
+def test_secret_fraction_is_a_fraction(decoy, dead_time, distance):
+    stats = simulate_link(10**6, distance_km=distance, dead_time_pulses=dead_time,
+                          afterpulse_prob=0.01, decoy=decoy, rng=0)
+    assert 0 <= stats["secret_fraction"] <= 1
+    assert stats["single_photon_gain"] <= stats["gain"]
+
+
+@pytest.mark.parametrize("protocol", ["bb84", "decoy"])
+def test_dead_time_never_raises_key_rate(protocol):
+    kwargs = {"n_pulses": 10**6, "protocol": protocol, "mu": 0.2}
+    free = keyrate_curve(DISTANCES, rng=0, **kwargs)
+    blind = keyrate_curve(DISTANCES, rng=0, dead_time_pulses=5, **kwargs)
+    closed = keyrate_curve(DISTANCES, protocol=protocol, mu=0.2)
+    for f, b, c in zip(free, blind, closed):
+        assert b["key_rate_bps"] <= f["key_rate_bps"]
+        assert b["key_rate_bps"] <= c["key_rate_bps"] * 1.02
+
+
+@pytest.mark.parametrize("distance", DISTANCES)
+def test_monte_carlo_matches_closed_form(distance):
+    sim = simulate_link(10**6, distance_km=distance, rng=1)
+    ref = expected_link(distance_km=distance)
+    for key in ("gain", "single_photon_gain", "secret_fraction"):
+        assert sim[key] == pytest.approx(ref[key], rel=0.05)
+
+
+def test_decoy_states_beat_plain_bb84():
+    plain = keyrate_curve(DISTANCES, protocol="bb84")
+    decoy = keyrate_curve(DISTANCES, protocol="decoy")
+    assert all(p["key_rate_bps"] <= d["key_rate_bps"] for p, d in zip(plain, decoy))
+    assert plain[-1]["key_rate_bps"] == 0 < decoy[-1]["key_rate_bps"]
@@ -0,0 +1,50 @@
+# tests/test_pipeline.py
+# Post-processing stages: Cascade leaves Bob with Alice's key, the digest tells
+# keys apart, and a full key buffer holds the producer back instead of dropping key.
+
+import threading
+
+import numpy as np
+import pytest
+
+from qkd_backend.qkd_runner.pipeline import KeyBuffer, cascade_correct, key_digest
+
+
+@pytest.mark.parametrize("qber", [0.0, 0.02, 0.05, 0.08])
+@pytest.mark.parametrize("seed", range(5))
+def test_cascade_corrects_errors(qber, seed):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2, 2000)
+    b = a ^ (rng.random(2000) < qber)
+    corrected, leaked = cascade_correct(a, b, rng=seed)
+    assert np.array_equal(corrected, a)
+    assert leaked < len(a)
+
+
+def test_cascade_empty_key():
+    corrected, leaked = cascade_correct([], [])
+    assert len(corrected) == 0 and leaked == 0
+
+
+def test_key_digest_tells_keys_apart():
+    a = np.random.default_rng(0).integers(0, 2, 512)
+    b = a.copy()
+    b[100] ^= 1
+    assert key_digest(a) == key_digest(a.tolist())
+    assert key_digest(a) != key_digest(b)
+    assert len(key_digest(a)) == 8
+
+
+def test_full_buffer_blocks_until_taken():
+    buf = KeyBuffer(capacity=8)
+    assert buf.append(b"12345678")
+    assert not buf.append(b"9", timeout=0.05)
+    assert len(buf) == 8
+
+    done = threading.Event()
+    threading.Thread(target=lambda: buf.append(b"9") and done.set(), daemon=True).start()
+    assert not done.wait(0.05)
+    assert buf.take(4) == b"1234"
+    assert done.wait(1)
+    assert buf.take(5, timeout=1) == b"56789"
+    assert buf.take(1, timeout=0.05) is None
@@ -0,0 +1,77 @@
+# tests/test_stabilizer.py
+# The numpy stabilizer simulation in stabilizer.py against exact references:
+# Statevector Pauli expectations for every single-qubit Clifford sequence up to
+# length 3, and Aer's counts for multi-qubit circuits with mid-circuit measure/reset.
+
+import itertools
+
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.quantum_info import Pauli, Statevector
+from qiskit_aer import AerSimulator
+
+from qkd_backend.qkd_runner.stabilizer import (
+    SINGLE_QUBIT_CLIFFORD, X, Y, Z, _apply, is_product_clifford, run_counts, sample_product_clifford,
+)
+
+GATES = sorted(SINGLE_QUBIT_CLIFFORD)
+SEQUENCES = [seq for k in range(4) for seq in itertools.product(GATES, repeat=k)]
+
+
+def _expected_stabilizer(seq):
+    # The one Pauli with expectation +-1 on the state seq|0>, as (axis, sign)
+    qc = QuantumCircuit(1)
+    for name in seq:
+        getattr(qc, name)(0)
+    state = Statevector(qc)
+    for axis, label in ((Z, "Z"), (X, "X"), (Y, "Y")):
+        value = state.expectation_value(Pauli(label)).real
+        if abs(abs(value) - 1) < 1e-9:
+            return axis, value < 0
+    raise AssertionError(f"{seq} is not a stabilizer state")
+
+
+@pytest.mark.parametrize("seq", SEQUENCES, ids=lambda seq: "-".join(seq) or "empty")
+def test_apply_matches_statevector(seq):
+    axis = np.full(1, Z, dtype=np.uint8)
+    sign = np.zeros(1, dtype=bool)
+    for name in seq:
+        _apply(name, axis, sign)
+    assert (int(axis[0]), bool(sign[0])) == _expected_stabilizer(seq)
+
+
+def _random_product_circuit(rng, n=5, depth=25):
+    qc = QuantumCircuit(n, n)
+    for _ in range(depth):
+        q = int(rng.integers(n))
+        r = rng.random()
+        if r < 0.1:
+            qc.measure(q, int(rng.integers(n)))
+        elif r < 0.15:
+            qc.reset(q)
+        else:
+            getattr(qc, GATES[rng.integers(len(GATES))])(q)
+    qc.measure(range(n), range(n))
+    return qc
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sample_matches_aer(seed):
+    shots = 20_000
+    qc = _random_product_circuit(np.random.default_rng(seed))
+    assert is_product_clifford(qc)
+    ours = sample_product_clifford(qc, shots, seed=seed)
+    aer = AerSimulator().run(qc, shots=shots, seed_simulator=seed).result().get_counts()
+    for outcome in set(ours) | set(aer):
+        assert abs(ours.get(outcome, 0) - aer.get(outcome, 0)) / shots < 0.03, outcome
+
+
+def test_entangled_circuit_goes_to_aer():
+    qc = QuantumCircuit(2, 2)
+    qc.h(0)
+    qc.cx(0, 1)
+    qc.measure([0, 1], [0, 1])
+    assert not is_product_clifford(qc)
+    counts = run_counts(qc, shots=1000, seed=1)
+    assert set(counts) <= {"00", "11"} and sum(counts.values()) == 1000
@@ -0,0 +1,6 @@
+# wsgi.py
+# WSGI entry point for production serving (see gunicorn.conf.py):
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+
+from app import app as application